@@ -0,0 +1,107 @@
+import multiprocessing
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import SimpleITK as sitk
+
+from radiomics_extraction import VolumeSlicer, calc_pyradiomics
+
+
+def random_volume(size=(128, 128, 64), seed=0):
+    # image and segmentation in the SimpleITK (x, y, z) order, the numpy arrays are (z, y, x)
+    rng = np.random.default_rng(seed)
+    image = sitk.GetImageFromArray(rng.random(size[::-1], dtype=np.float32))
+    segmentation = np.zeros(size[::-1], dtype=np.uint8)
+    segmentation[:, size[1] // 4: 3 * size[1] // 4, size[0] // 4: 3 * size[0] // 4] = 1
+    segmentation = sitk.GetImageFromArray(segmentation)
+    segmentation.CopyInformation(image)
+    return image, segmentation
+
+
+def benchmark_parallel(size=(128, 128, 64), n_workers=(1, 2, 4, None)):
+    # compare the wall time of the serial and the parallel per slice extraction
+    image, segmentation = random_volume(size)
+    reference = None
+
+    for workers in n_workers:
+        with tempfile.TemporaryDirectory() as save_folder:
+            start = time.perf_counter()
+            results = calc_pyradiomics(image, segmentation, save_folder, "bench", whole_volume=False,
+                                       n_workers=workers)
+            duration = time.perf_counter() - start
+
+        # the parallel extraction has to return exactly the same features in the same slice order
+        if reference is None:
+            reference = results
+        else:
+            assert [r["Slice_Nr"] for r in results] == [r["Slice_Nr"] for r in reference]
+            assert all(str(r) == str(ref) for r, ref in zip(results, reference))
+
+        print(f"n_workers={workers}: {duration:.2f} s total, {duration / size[2] * 1000:.1f} ms per slice")
+
+
+def numpy_roundtrip_slices(image, segmentation):
+    # the slicing as it was done before VolumeSlicer: several copies and a multiplication per slice
+    for slice_nr in range(image.GetDepth()):
+        image_slice = np.expand_dims(sitk.GetArrayFromImage(image[:, :, slice_nr]) * 1000, -1)
+        segm_slice = np.expand_dims(sitk.GetArrayFromImage(segmentation[:, :, slice_nr]), -1)
+        yield image_slice, segm_slice
+
+
+def view_slices(image, segmentation):
+    slicer = VolumeSlicer(image, segmentation)
+    for slice_nr in range(image.GetDepth()):
+        yield slicer(slice_nr)
+
+
+def _run_slicing(method, size, queue):
+    # runs in its own process so that the peak RSS of each method is measured separately
+    image, segmentation = random_volume(size)
+
+    # numpy reports its allocations to tracemalloc, SimpleITK does not
+    tracemalloc.start()
+    start = time.perf_counter()
+    for image_slice, segm_slice in method(image, segmentation):
+        # both methods end in the SimpleITK images which are passed to the extractor
+        image_slice = sitk.GetImageFromArray(image_slice, isVector=False)
+        segm_slice = sitk.GetImageFromArray(segm_slice, isVector=False)
+    duration = time.perf_counter() - start
+    _, numpy_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # ru_maxrss is given in kB on linux
+    queue.put((duration, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, numpy_peak))
+
+
+def benchmark_slicing(size=(512, 512, 300)):
+    # compare the time per slice and the peak memory of the slicing methods
+    # VolumeSlicer trades one scaled copy of the volume for the copies and the multiplication of every slice
+    queue = multiprocessing.Queue()
+    for method in [numpy_roundtrip_slices, view_slices]:
+        process = multiprocessing.Process(target=_run_slicing, args=(method, size, queue))
+        process.start()
+        duration, peak_rss, numpy_peak = queue.get()
+        process.join()
+        print(f"{method.__name__}: {duration / size[2] * 1000:.2f} ms per slice, "
+              f"peak RSS {peak_rss / 2 ** 20:.0f} MB, peak numpy allocations {numpy_peak / 2 ** 20:.1f} MB")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="radiomics extraction benchmarks")
+    parser.add_argument("--size", type=int, nargs=3, dest="size", default=[128, 128, 64],
+                        help="Size (x, y, z) of the random test volume.")
+    parser.add_argument("--n_workers", type=int, nargs="+", dest="n_workers", default=[1, 2, 4],
+                        help="Numbers of worker processes to compare, the first one is the reference.")
+    parser.add_argument("--benchmark", type=str, dest="benchmark", default="parallel",
+                        choices=["parallel", "slicing"], help="Benchmark to run.")
+    args = parser.parse_args()
+
+    if args.benchmark == "parallel":
+        benchmark_parallel(tuple(args.size), args.n_workers)
+    elif args.benchmark == "slicing":
+        benchmark_slicing(tuple(args.size))
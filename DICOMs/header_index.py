@@ -0,0 +1,120 @@
+import json
+import os
+
+from lazy_image_loader import load_image
+from simpleitk_numpy_image import HEADER_TAGS
+
+"""
+Index of the header tags of a cohort of images.
+The header of every series is read once and kept in a columnar table (one list per tag) which is saved as a json
+file, so cohort queries do not have to open the images again. refresh() only reads the series which are new or
+whose files changed since the last refresh.
+    index = HeaderIndex("cohort_index.json")
+    index.refresh(series_folders)
+    index.query(patient_ID="P001", flip_angle=lambda x: x is not None and float(x) > 10)
+"""
+
+
+def _modification_time(path):
+    # [newest modification time, number of files] of a file or of the files in a series folder
+    # (the number of files changes if a slice is removed, the newest modification time not always)
+    if os.path.isdir(path):
+        mtimes = [entry.stat().st_mtime for entry in os.scandir(path) if entry.is_file()]
+        return [max(mtimes, default=0.0), len(mtimes)]
+    return [os.path.getmtime(path), 1]
+
+
+class HeaderIndex:
+    def __init__(self, filename=None, tags=None):
+        # filename: json file in which the index is saved, None for an index which is only held in memory
+        # tags: names of HEADER_TAGS or DICOM tags of the meta data, e.g. "0020|0013"
+        self.filename = filename
+        self.tags = list(tags or HEADER_TAGS)
+        self.columns = {name: [] for name in ["path", "mtime", "spacing", "shape"] + self.tags}
+        self._rows = {}  # path -> row number
+
+        if filename is not None and os.path.exists(filename):
+            self.load()
+
+    def __len__(self):
+        return len(self.columns["path"])
+
+    def __contains__(self, path):
+        return path in self._rows
+
+    def load(self):
+        with open(self.filename, "r", encoding="utf-8") as f:
+            columns = json.load(f)
+        if set(self.tags) - set(columns):
+            # the tags changed -> the whole index has to be rebuilt
+            return
+        self.columns = {name: columns[name] for name in self.columns}
+        self._rows = {path: row for row, path in enumerate(self.columns["path"])}
+
+    def save(self):
+        # write to a temporary file first -> the index file is never left half written
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as f:
+            json.dump(self.columns, f)
+        os.replace(tmp_filename, self.filename)
+
+    def add(self, image, path=None, mtime=None):
+        # add the header of an AbstractImage, an existing row of the same path is replaced
+        path = path or image.folder_name
+        header = image.header
+        keys = set(image.GetMetaDataKeys())
+        values = dict(path=path, mtime=mtime, spacing=list(image.GetSpacing()), shape=list(image.GetSize()),
+                      **{name: header[name] if name in header else image.GetMetaData(name) if name in keys else None
+                         for name in self.tags})
+
+        row = self._rows.get(path)
+        if row is None:
+            self._rows[path] = len(self)
+            for name, column in self.columns.items():
+                column.append(values[name])
+        else:
+            for name, column in self.columns.items():
+                column[row] = values[name]
+
+    def remove(self, path):
+        row = self._rows.pop(path)
+        for column in self.columns.values():
+            del column[row]
+        self._rows = {path: row for row, path in enumerate(self.columns["path"])}
+
+    def refresh(self, paths, loader=load_image, prune=False, save=True):
+        # read the headers of the new and the modified series, the voxels are never read (lazy loading)
+        # prune=True removes the series which are not in paths anymore
+        paths = list(paths)
+        n_read = 0
+        for path in paths:
+            mtime = _modification_time(path)
+            row = self._rows.get(path)
+            if row is not None and self.columns["mtime"][row] == mtime:
+                continue
+            self.add(loader(path), path, mtime)
+            n_read += 1
+
+        if prune:
+            for path in set(self._rows) - set(paths):
+                self.remove(path)
+
+        if save and self.filename is not None:
+            self.save()
+        return n_read
+
+    def query(self, **conditions):
+        # paths of the series fulfilling all conditions, a condition is a value or a function returning a bool
+        rows = range(len(self))
+        for name, condition in conditions.items():
+            column = self.columns[name]
+            if callable(condition):
+                rows = [row for row in rows if condition(column[row])]
+            else:
+                rows = [row for row in rows if column[row] == condition]
+        return [self.columns["path"][row] for row in rows]
+
+    def select(self, *names, paths=None):
+        # the columns names for all series or the given paths
+        rows = range(len(self)) if paths is None else [self._rows[path] for path in paths]
+        return {name: [self.columns[name][row] for row in rows] for name in names}
@@ -0,0 +1,111 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+import torch
+
+"""
+Collection of AbstractImages with the same geometry which are stacked into one (N, ...) numpy array or torch tensor.
+The output is preallocated and every image is copied (and converted to its np_dtype) once into its place, so the
+per image np_data/torch_data arrays and the copy of np.stack/torch.stack are not needed.
+    batch = ImageBatch(images)
+    batch.to_numpy()                   # shape (N,) + np_data.shape
+    batch.to_torch(pin_memory=True)    # shape (N,) + torch_data.shape
+    for tensor in iter_batches(images, batch_size=8, as_torch=True):  # next batches are built in the background
+        ...
+"""
+
+
+class ImageBatch:
+    def __init__(self, images, check_geometry=True, tolerance=1e-5):
+        self.images = list(images)
+        if not self.images:
+            raise ValueError("An ImageBatch needs at least one image")
+        if check_geometry:
+            self.check_geometry(tolerance)
+
+    def check_geometry(self, tolerance=1e-5):
+        # all images need the same size, spacing and direction, the origin may differ
+        reference = self.images[0]
+        for image in self.images[1:]:
+            if image.GetSize() != reference.GetSize():
+                raise ValueError(f"Size {image.GetSize()} of {image.sequence_name} differs from {reference.GetSize()}")
+            if not np.allclose(image.GetSpacing(), reference.GetSpacing(), atol=tolerance):
+                raise ValueError(f"Spacing {image.GetSpacing()} of {image.sequence_name} differs from "
+                                 f"{reference.GetSpacing()}")
+            if not np.allclose(image.GetDirection(), reference.GetDirection(), atol=tolerance):
+                raise ValueError(f"Direction of {image.sequence_name} differs from the first image")
+
+    def __len__(self):
+        return len(self.images)
+
+    def __getitem__(self, index):
+        return self.images[index]
+
+    def __iter__(self):
+        return iter(self.images)
+
+    @property
+    def dtype(self):
+        return np.dtype(self.images[0].np_dtype)
+
+    @property
+    def shape(self):
+        # np_data is in the saggital view: SimpleITK size (x, y, z) -> (y, x, z)
+        x, y, z = self.images[0].GetSize()
+        return len(self), y, x, z
+
+    def _copy_all(self, targets, executor=None):
+        # targets[i] is the (y, x, z) view of the output of image i
+        if executor is None:
+            for image, target in zip(self.images, targets):
+                image.copy_to(target)
+        else:
+            list(executor.map(lambda args: args[0].copy_to(args[1]), zip(self.images, targets)))
+
+    def to_numpy(self, out=None, executor=None):
+        if out is None:
+            out = np.empty(self.shape, dtype=self.dtype)
+        elif out.shape != self.shape:
+            raise ValueError(f"out has the shape {out.shape} instead of {self.shape}")
+        self._copy_all(out, executor)
+        return out
+
+    def to_torch(self, pin_memory=False, out=None, executor=None):
+        # same layout as torch_data: np_data.permute(2, 1, 0) -> (z, x, y)
+        n, y, x, z = self.shape
+        dtype = torch.from_numpy(np.empty(0, self.dtype)).dtype
+        if out is None:
+            out = torch.empty((n, z, x, y), dtype=dtype, pin_memory=pin_memory)
+        elif tuple(out.shape) != (n, z, x, y):
+            raise ValueError(f"out has the shape {tuple(out.shape)} instead of {(n, z, x, y)}")
+        elif out.dtype != dtype:
+            raise ValueError(f"out has the dtype {out.dtype} instead of {dtype}")
+        elif out.device.type != "cpu":
+            raise ValueError(f"out has to be a cpu tensor, not on {out.device}")
+        # the numpy arrays share the memory of the tensor, transposed back to (y, x, z)
+        self._copy_all([out[i].numpy().transpose((2, 1, 0)) for i in range(n)], executor)
+        return out
+
+
+def iter_batches(images, batch_size, as_torch=False, pin_memory=False, prefetch=2, n_threads=4,
+                 check_geometry=True):
+    # yields the stacked batches of images while the next prefetch batches are built across a thread pool
+    # (copying and lazy loading release the GIL)
+    images = iter(images)
+
+    def build(batch):
+        batch = ImageBatch(batch, check_geometry)
+        return batch.to_torch(pin_memory) if as_torch else batch.to_numpy()
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        pending = []
+        while True:
+            while len(pending) <= prefetch:
+                batch = list(islice(images, batch_size))
+                if not batch:
+                    break
+                pending.append(executor.submit(build, batch))
+            if not pending:
+                return
+            yield pending.pop(0).result()
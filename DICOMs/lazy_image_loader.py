@@ -0,0 +1,184 @@
+import os
+import struct
+
+import numpy as np
+import SimpleITK as sitk
+
+from simpleitk_numpy_image import AbstractImage
+
+"""
+Lazy loading of DICOM series and NIfTI files into AbstractImages.
+The meta data (size, spacing, origin, direction and the header tags) is read when the image is created, the
+voxels only when they are used for the first time. So header, spacing and shape of a whole cohort can be read
+without touching any pixel data, and single slices can be read without loading the volume:
+    img = load_image("/path/to/dicom/folder")
+    img.header, img.spacing, img.shape  # no pixel data read
+    img.get_slice(10)                   # only the 10th slice is read
+    img.np_data                         # the whole volume is read
+Uncompressed NIfTI files without intensity scaling are memory-mapped, np_data and get_slice then read directly from
+the file.
+"""
+
+# nifti datatype codes -> numpy dtypes
+NIFTI_DTYPES = {2: np.uint8, 4: np.int16, 8: np.int32, 16: np.float32, 64: np.float64, 256: np.int8,
+                512: np.uint16, 768: np.uint32, 1024: np.int64, 1280: np.uint64}
+
+
+def _read_information(filename):
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(filename)
+    reader.ReadImageInformation()
+    return reader
+
+
+class LazyImage(AbstractImage):
+    def __init__(self, filenames, info, sequence_name="", folder_name="", slice_number=-1, memmap=None):
+        # filenames: the files of a DICOM series (one per slice) or a list with a single file
+        # info: size, spacing, origin, direction and the meta data of the image
+        # no AbstractImage.__init__: it would set (and read) the SimpleITK image
+        self._init_state(sequence_name, folder_name, slice_number)
+        self._image = None
+        self.filenames = filenames
+        self.info = info
+        self.memmap = memmap
+
+    @property
+    def _data(self):
+        # the voxels are read on the first access of the SimpleITK image
+        if self._image is None:
+            self._image = self._read_volume()
+        return self._image
+
+    @_data.setter
+    def _data(self, x):
+        self._image = x
+
+    @property
+    def loaded(self):
+        return self._image is not None
+
+    def _read_volume(self):
+        if len(self.filenames) == 1:
+            return sitk.ReadImage(self.filenames[0])
+        reader = sitk.ImageSeriesReader()
+        reader.SetFileNames(self.filenames)
+        image = reader.Execute()
+        # the series reader does not keep the tags -> use the ones of the first slice as done for the header
+        for key, value in self.info["meta_data"].items():
+            image.SetMetaData(key, value)
+        return image
+
+    @property
+    def np_data(self):
+        if self._np_cache is None and not self.loaded and self.memmap is not None:
+            array = self.memmap
+            if array.dtype != self.np_dtype:
+                array = array.astype(self.np_dtype)
+                array.flags.writeable = False
+            self._np_cache = array.transpose((1, 2, 0))  # to saggital view
+        return super().np_data
+
+    def copy_to(self, out):
+        # copy directly from the memory-mapped file
+        if self._np_cache is None and not self.loaded and self.memmap is not None:
+            np.copyto(out, self.memmap.transpose((1, 2, 0)), casting="unsafe")
+            return out
+        return super().copy_to(out)
+
+    def get_slice(self, slice_nr):
+        # numpy array (y, x) of one slice, like np_data[:, :, slice_nr] but without reading the whole volume
+        if self.loaded or self._np_cache is not None:
+            return self.np_data[:, :, slice_nr]
+        if self.memmap is not None:
+            return np.asarray(self.memmap[slice_nr]).astype(self.np_dtype)
+        if len(self.filenames) > 1:
+            image = sitk.ReadImage(self.filenames[slice_nr])
+        else:
+            # let ITK read only the region of the slice
+            reader = sitk.ImageFileReader()
+            reader.SetFileName(self.filenames[0])
+            reader.SetExtractIndex([0, 0, slice_nr])
+            reader.SetExtractSize(list(self.info["size"][:2]) + [1])
+            image = reader.Execute()
+        return sitk.GetArrayFromImage(image).reshape(self.info["size"][1::-1]).astype(self.np_dtype)
+
+    # the geometry and the meta data are served from the eagerly read information until the image is loaded
+    def GetSpacing(self):
+        return self._image.GetSpacing() if self.loaded else self.info["spacing"]
+
+    def GetOrigin(self):
+        return self._image.GetOrigin() if self.loaded else self.info["origin"]
+
+    def GetDirection(self):
+        return self._image.GetDirection() if self.loaded else self.info["direction"]
+
+    def GetSize(self):
+        return self._image.GetSize() if self.loaded else self.info["size"]
+
+    def GetDepth(self):
+        return self._image.GetDepth() if self.loaded else (self.info["size"] + (0,))[2]
+
+    def GetDimension(self):
+        return self._image.GetDimension() if self.loaded else len(self.info["size"])
+
+    def GetMetaDataKeys(self):
+        return self._image.GetMetaDataKeys() if self.loaded else tuple(self.info["meta_data"])
+
+    def GetMetaData(self, key):
+        return self._image.GetMetaData(key) if self.loaded else self.info["meta_data"][key]
+
+
+def _information(reader, size=None, spacing=None):
+    return dict(size=tuple(size or reader.GetSize()),
+                spacing=tuple(spacing or reader.GetSpacing()),
+                origin=reader.GetOrigin(),
+                direction=reader.GetDirection(),
+                meta_data={key: reader.GetMetaData(key) for key in reader.GetMetaDataKeys()})
+
+
+def load_dicom_series(folder, series_id=None, **kwargs):
+    filenames = sitk.ImageSeriesReader.GetGDCMSeriesFileNames(folder, series_id or "")
+    if not filenames:
+        raise ValueError(f"No DICOM series found in {folder}")
+
+    # the tags of the first slice, the slice distance from the positions of the first two slices
+    first = _read_information(filenames[0])
+    size = first.GetSize()[:2] + (len(filenames),)
+    spacing = first.GetSpacing()
+    if len(filenames) > 1:
+        second = _read_information(filenames[1])
+        distance = np.linalg.norm(np.subtract(second.GetOrigin(), first.GetOrigin()))
+        spacing = spacing[:2] + (float(distance) or spacing[2],)
+
+    kwargs.setdefault("folder_name", folder)
+    return LazyImage(list(filenames), _information(first, size, spacing), **kwargs)
+
+
+def _nifti_memmap(filename, reader):
+    # memory-map the voxels of an uncompressed nifti file, None if the file cannot be mapped
+    meta = {key: reader.GetMetaData(key) for key in reader.GetMetaDataKeys()}
+    dtype = NIFTI_DTYPES.get(int(meta.get("datatype", 0)))
+    scaled = float(meta.get("scl_slope", 0)) not in (0, 1) or float(meta.get("scl_inter", 0)) != 0
+    if filename.endswith(".gz") or dtype is None or scaled or reader.GetNumberOfComponents() != 1:
+        return None
+
+    # the header starts with sizeof_hdr (348 or 540) which gives the byte order
+    with open(filename, "rb") as f:
+        byte_order = "<" if struct.unpack("<i", f.read(4))[0] in (348, 540) else ">"
+    shape = reader.GetSize()[::-1]
+    memmap = np.memmap(filename, dtype=np.dtype(dtype).newbyteorder(byte_order), mode="r",
+                       offset=int(float(meta["vox_offset"])), shape=shape)
+    return memmap.reshape((1,) * (3 - len(shape)) + shape)
+
+
+def load_nifti(filename, **kwargs):
+    reader = _read_information(filename)
+    kwargs.setdefault("folder_name", os.path.dirname(filename))
+    return LazyImage([filename], _information(reader), memmap=_nifti_memmap(filename, reader), **kwargs)
+
+
+def load_image(path, **kwargs):
+    # DICOM folder or NIfTI (or any other SimpleITK readable) file
+    if os.path.isdir(path):
+        return load_dicom_series(path, **kwargs)
+    return load_nifti(path, **kwargs)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+import radiomics
+import SimpleITK as sitk
+
+"""
+On-disk cache for radiomics features.
+The entries are addressed by the content of the image and the mask (voxel buffer, spacing and direction) and by
+the extractor configuration (settings, enabled image types and features), so an unchanged image/mask pair never
+has to be extracted twice while any change of the data or the configuration leads to a new entry.
+Each entry is one pickle file in the cache folder, the least recently used entries are removed when the size of
+all entries exceeds max_bytes. The folder can be shared by several processes: the entries are scanned again before
+each eviction, so the entries of the other processes count for max_bytes too.
+"""
+
+
+def array_digest(array, spacing, direction=()):
+    # hash of the voxel buffer and the geometry which influences the features
+    array = np.ascontiguousarray(array)
+    h = hashlib.sha256()
+    h.update(str((array.dtype.str, array.shape, tuple(spacing), tuple(direction))).encode())
+    h.update(memoryview(array).cast("B"))
+    return h.hexdigest()
+
+
+def image_digest(image):
+    # GetArrayViewFromImage -> the voxel buffer is hashed without copying it
+    return array_digest(sitk.GetArrayViewFromImage(image), image.GetSpacing(), image.GetDirection())
+
+
+def extractor_digest(extractor):
+    config = dict(version=radiomics.__version__,
+                  settings=extractor.settings,
+                  image_types=extractor.enabledImagetypes,
+                  features=extractor.enabledFeatures)
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class FeatureCache:
+    def __init__(self, cache_folder, max_bytes=2 ** 30):
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # key -> size of the entry, the least recently used entry comes first
+        os.makedirs(cache_folder, exist_ok=True)
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._scan()
+
+    def _scan(self):
+        # the entries in the folder, also the ones written (or removed) by other processes, in the order of use
+        entries = []
+        for entry in os.scandir(self.cache_folder):
+            if entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # removed by another process in the meantime
+                    continue
+                entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._total_bytes = sum(self._entries.values())
+
+    @staticmethod
+    def key(extractor, *digests):
+        # digests are the array_digest/image_digest of the image and the mask
+        return hashlib.sha256("".join((extractor_digest(extractor),) + digests).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_folder, key + ".pkl")
+
+    def get(self, key):
+        # returns the cached features or None
+        try:
+            with open(self._path(key), "rb") as f:
+                result = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        # mark the entry as recently used, also for other processes sharing the cache folder
+        try:
+            os.utime(self._path(key))
+            size = os.path.getsize(self._path(key))
+        except FileNotFoundError:  # removed by another process after it was read
+            return result
+        # entries written by other processes are counted from their first use on
+        self._total_bytes += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+        return result
+
+    def put(self, key, result):
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+
+        # write to a temporary file first -> readers never see a half written entry
+        tmp_path = self._path(key) + f".{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        # a scan of the folder is cheap compared to the extraction of the features of an entry
+        self._scan()
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:  # already removed by another process
+                pass
+
+    def clear(self):
+        while self._entries:
+            key, _ = self._entries.popitem()
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+        self._total_bytes = 0
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    hit_rate=self.hits / requests if requests else 0.0,
+                    entries=len(self._entries), bytes=self._total_bytes)
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,10 +1,129 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
 from radiomics import featureextractor
 import SimpleITK as sitk
+import numpy as np
 import json
 
+from radiomics_cache import array_digest, image_digest
+from radiomics_writers import MultiWriter, to_json
+
+# feature extractor of a worker process, built once by _init_worker and reused for all its slices
+_worker_extractor = None
+
+
+def _create_slice_extractor(params):
+    extractor = featureextractor.RadiomicsFeaturesExtractor(**params)
+    extractor.enableAllImageTypes()
+    return extractor
+
+
+def _init_worker(params):
+    global _worker_extractor
+    _worker_extractor = _create_slice_extractor(params)
+
+
+class VolumeSlicer:
+    # gives the image and segmentation slices as numpy views of shape (y, x, 1)
+    # the intensity scaling is done once for the whole volume and the segmentation is never copied,
+    # only the slices which are sent to other processes get copied (pickled)
+    def __init__(self, image, segmentation, intensity_scale=1000):
+        self.image_array = sitk.GetArrayViewFromImage(image) * intensity_scale
+        # the view is only valid as long as the SimpleITK image exists -> keep a reference
+        self._segmentation = segmentation
+        self.segm_array = sitk.GetArrayViewFromImage(segmentation)
+
+    def __call__(self, slice_nr):
+        return self.image_array[slice_nr, :, :, np.newaxis], self.segm_array[slice_nr, :, :, np.newaxis]
+
+
+def _extract_slice(extractor, image_slice, segm_slice, spacing):
+    image_slice = sitk.GetImageFromArray(image_slice, isVector=False)
+    image_slice.SetSpacing(spacing)
+    segm_slice = sitk.GetImageFromArray(segm_slice, isVector=False)
+
+    # we assume that the image and segmentation have the same geometric information
+    segm_slice.CopyInformation(image_slice)
+
+    # extract the features
+    return extractor.execute(image_slice, segm_slice)
+
+
+def _add_slice_nr(result, slice_nr):
+    # add the key Slice_Nr at the beginning of the OrderedDict result
+    result.update({'Slice_Nr': slice_nr+1})
+    result.move_to_end('Slice_Nr', last=False)
+    return result
+
+
+def _extract_chunk(chunk):
+    # runs in a worker process, chunk is a list of (image_slice, segm_slice, spacing)
+    return [_extract_slice(_worker_extractor, *item) for item in chunk]
+
+
+def _iter_slice_results(image, segmentation, slice_numbers, params, n_workers=1, chunk_size=None, cache=None):
+    # yields the features of each slice in the order of slice_numbers
+    # each slice has its own cache entry -> editing one slice only invalidates this slice
+    spacing = image.GetSpacing()
+    # with workers the parent process only needs an extractor for the cache keys (its configuration)
+    extractor = _create_slice_extractor(params) if n_workers == 1 or cache is not None else None
+    slicer = VolumeSlicer(image, segmentation)
+
+    def cache_lookup(image_slice, segm_slice):
+        if cache is None:
+            return None, None
+        key = cache.key(extractor, array_digest(image_slice, spacing), array_digest(segm_slice, spacing))
+        return key, cache.get(key)
+
+    if n_workers == 1:
+        for slice_nr in slice_numbers:
+            image_slice, segm_slice = slicer(slice_nr)
+            key, result = cache_lookup(image_slice, segm_slice)
+            if result is None:
+                result = _extract_slice(extractor, image_slice, segm_slice, spacing)
+                if cache is not None:
+                    cache.put(key, result)
+            yield _add_slice_nr(result, slice_nr)
+        return
+
+    n_workers = n_workers or os.cpu_count()
+    if chunk_size is None:
+        # a few chunks per worker keeps all workers busy while amortizing the inter-process overhead
+        chunk_size = max(1, -(-len(slice_numbers) // (4 * n_workers)))
+
+    # the SimpleITK images are not sent to the workers, only the numpy slices -> cheap to pickle
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(params,)) as executor:
+        # only the slices which are not cached are sent to the workers
+        slices, futures, chunk = [], [], []
+        for slice_nr in slice_numbers:
+            image_slice, segm_slice = slicer(slice_nr)
+            key, result = cache_lookup(image_slice, segm_slice)
+            slices.append((slice_nr, key, result))
+            if result is None:
+                chunk.append((image_slice, segm_slice, spacing))
+                if len(chunk) == chunk_size:
+                    futures.append(executor.submit(_extract_chunk, chunk))
+                    chunk = []
+        if chunk:
+            futures.append(executor.submit(_extract_chunk, chunk))
+
+        # the futures are in the order of the slices which were not cached
+        extracted = (result for future in futures for result in future.result())
+        for slice_nr, key, result in slices:
+            if result is None:
+                result = next(extracted)
+                if cache is not None:
+                    cache.put(key, result)
+            yield _add_slice_nr(result, slice_nr)
+
+
 # Radiomics needs the images to be of the SimpleITK image type to extract features from the images
-def calc_pyradiomics(image, segmentation, save_folder, sequence_name, whole_volume=True, slice_numbers=None):
+# n_workers defines the number of processes used for the per slice extraction (None -> one per cpu core)
+# the per slice features are streamed to a csv and a json lines file and optionally to a columnar file ("npz" or
+# "parquet"), keep_results=False avoids holding the features of all slices in memory
+# cache (a radiomics_cache.FeatureCache) returns the features of unchanged image/mask pairs without extracting them
+def calc_pyradiomics(image, segmentation, save_folder, sequence_name, whole_volume=True, slice_numbers=None,
+                     n_workers=1, chunk_size=None, columnar_format=None, keep_results=True, cache=None):
     if whole_volume and slice_numbers:
         print("whole_volume cannot be True and slice_numbers defined at the same time")
         return ValueError
@@ -26,8 +145,13 @@ def calc_pyradiomics(image, segmentation, save_folder, sequence_name, whole_volu
         # Only enable mean and skewness in firstorder
         # extractor.enableFeaturesByName(firstorder=['Mean', 'Skewness'])
 
-        # extract the features
-        result = extractor.execute(image, mask)
+        # extract the features or take them from the cache
+        key = cache.key(extractor, image_digest(image), image_digest(segmentation)) if cache is not None else None
+        result = cache.get(key) if cache is not None else None
+        if result is None:
+            result = extractor.execute(image, segmentation)
+            if cache is not None:
+                cache.put(key, result)
         
         # save the results to a csv and a json file
         filename = os.path.join(save_folder, sequence_name + "_whole_volume")
@@ -42,24 +166,17 @@ def calc_pyradiomics(image, segmentation, save_folder, sequence_name, whole_volu
 
         # save as json
         with open(filename + ".json", "w") as f:
-            json.dump(result, f)
+            json.dump(result, f, default=to_json)
         
         return result
 
     else:
         # define the parameters you want to set for the feature extractor
         params={"force2D": True}
-        # Create the feature extractor
-        extractor = featureextractor.RadiomicsFeaturesExtractor(**params)
-        extractor.enableAllImageTypes()
-
-        # define a SimpleITK image slicer
-        slicer = sitk.ExtractImageFilter()
-        slicer.SetSize(list(image.GetSize()[:2])+[0])
 
         # extract the features from all image slices if not defined otherwise
         if not slice_numbers:
-            slice_numbers = list(np.arange(image.GetDepth()))
+            slice_numbers = list(range(image.GetDepth()))
         else:
             assert type(slice_numbers) == list
 
@@ -67,58 +184,30 @@ def calc_pyradiomics(image, segmentation, save_folder, sequence_name, whole_volu
         os.makedirs(save_folder, exist_ok=True)
 
         # create a list to save the features of each slice
-        result_list = []
+        result_list = [] if keep_results else None
 
-        for slice_nr in slice_numbers:
-            # slice the image
-            image_slice = np.expand_dims(sitk.GetArrayFromImage(image[:, :, slice_nr]) * 1000, -1)
-            image_slice = sitk.GetImageFromArray(image_slice, isVector=False)
-            image_slice.SetSpacing(image.GetSpacing())
-
-            # slice the segmentation
-            segm_slice = np.expand_dims(sitk.GetArrayFromImage(segmentation[:, :, slice_nr]), -1)
-            segm_slice = sitk.GetImageFromArray(segm_slice, isVector=False)
-            
-            # we assume that the image and segmentation have the same geometric information
-            segm_slice.CopyInformation(image_slice)  
-
-            # extract the features
-            result = extractor.execute(image_slice, segm_slice)
-            
-            # add the key Slice_Nr at the beginning of the OrderedDict result
-            result.update({'Slice_Nr': slice_nr+1})
-            result.move_to_end('Slice_Nr', last=False)
-            result_list.append(result)
-
-            # save as csv
-            with open(filename + ".csv", "w") as f:
-                for key in result_list[0].keys():
-                    f.write(str(key).replace(";", ",") + ";")
-                f.write("\n")
-                for result in result_list:
-                    for value in result.values():
-                        f.write(str(value).replace(";", ",") + ";")
-                    f.write("\n")
-
-            # save as json
-            with open(filename + ".json", "w", encoding="utf-8") as f:
-                json.dump(result_list, f)
+        # each slice is appended to the files as soon as it is finished
+        with MultiWriter(filename, columnar_format) as writer:
+            for result in _iter_slice_results(image, segmentation, slice_numbers, params, n_workers, chunk_size,
+                                              cache):
+                writer.write(result)
+                if keep_results:
+                    result_list.append(result)
 
         return result_list
 
 
 if __name__ == "__main__":
-    import numpy as np
-
     sequence_name = "seq1"
     save_folder = "/path/to/saving/folder"
 
     whole_volume = False
     slice_numbers = [1, 3, 6]
-    image_size = (64, 64)
-    
-    image = sitk.Image(image_size[0], image_size][1], sitk.sitkFloat32)
-    segmentation = sitk.GetImageFromArray(np.random.randint(0, 2, image_size)
+    n_workers = 4
+    image_size = (64, 64, 8)
+
+    image = sitk.GetImageFromArray(np.random.rand(*image_size[::-1]).astype(np.float32))
+    segmentation = sitk.GetImageFromArray(np.random.randint(0, 2, image_size[::-1]).astype(np.uint8))
 
     features = calc_pyradiomics(image, segmentation, save_folder, sequence_name,
-                                 whole_volume, slice_numbers)
+                                 whole_volume, slice_numbers, n_workers=n_workers)
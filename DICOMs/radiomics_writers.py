@@ -0,0 +1,194 @@
+import json
+import os
+import zipfile
+
+import numpy as np
+
+"""
+Streaming writers for the per slice radiomics features.
+Every writer gets the features of one slice at a time (an OrderedDict as returned by the extractor) and appends
+them to its file, so the files never have to be rewritten and the results do not need to be kept in memory.
+The text writers flush after each slice -> an interrupted run leaves valid files up to the last finished slice.
+"""
+
+
+def to_json(value):
+    # the radiomics results contain numpy scalars and arrays which the json module cannot serialize
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class ResultWriter:
+    extension = ""
+
+    def __init__(self, filename):
+        self.filename = filename + self.extension
+        self.n_rows = 0
+
+    def write(self, result):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class CsvWriter(ResultWriter):
+    # same layout as the csv files written so far: ';' separated with a header line
+    extension = ".csv"
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self._file = open(self.filename, "w")
+
+    def write(self, result):
+        if self.n_rows == 0:
+            self._file.write("".join(str(key).replace(";", ",") + ";" for key in result.keys()) + "\n")
+        self._file.write("".join(str(value).replace(";", ",") + ";" for value in result.values()) + "\n")
+        self._file.flush()
+        self.n_rows += 1
+
+    def close(self):
+        self._file.close()
+
+
+class JsonLinesWriter(ResultWriter):
+    # one json object per line and slice
+    extension = ".jsonl"
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self._file = open(self.filename, "w", encoding="utf-8")
+
+    def write(self, result):
+        self._file.write(json.dumps(result, default=to_json) + "\n")
+        self._file.flush()
+        self.n_rows += 1
+
+    def close(self):
+        self._file.close()
+
+
+class ColumnarWriter(ResultWriter):
+    # collects the features column wise, numeric features as float64 columns and everything else as strings
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.columns = {}
+
+    def write(self, result):
+        for key, value in result.items():
+            if np.ndim(value) == 0 and np.issubdtype(np.asarray(value).dtype, np.number):
+                value = float(value)
+            elif not isinstance(value, str):
+                value = json.dumps(value, default=to_json)
+            self.columns.setdefault(key, []).append(value)
+        self.n_rows += 1
+
+
+class NpzWriter(ColumnarWriter):
+    # every chunk_rows slices the columns are written to a part file (<filename>.part0000.npz, ...) -> at most
+    # chunk_rows slices in memory, an interrupted run leaves the parts up to the last full chunk
+    # close() merges the parts column by column into the npz archive (only one column of all slices in memory) and
+    # removes them, a temporary file and a rename prevent that an interrupted merge leaves a broken archive behind
+    extension = ".npz"
+
+    def __init__(self, filename, chunk_rows=256):
+        super().__init__(filename)
+        self.chunk_rows = chunk_rows
+        self._parts = []
+
+    def write(self, result):
+        super().write(result)
+        if len(next(iter(self.columns.values()))) >= self.chunk_rows:
+            self._write_part()
+
+    def _write_part(self):
+        part = f"{self.filename[:-len(self.extension)]}.part{len(self._parts):04d}.npz"
+        with open(part, "wb") as f:
+            np.savez(f, **{key: np.asarray(values) for key, values in self.columns.items()})
+        self._parts.append(part)
+        self.columns = {}
+
+    def close(self):
+        if self.columns:
+            self._write_part()
+        if not self._parts:
+            return
+        parts = [np.load(part) for part in self._parts]
+        tmp_filename = self.filename + ".tmp"
+        try:
+            with zipfile.ZipFile(tmp_filename, "w", allowZip64=True) as archive:
+                for key in dict.fromkeys(key for part in parts for key in part.files):
+                    column = np.concatenate([part[key] for part in parts if key in part.files])
+                    with archive.open(key + ".npy", "w", force_zip64=True) as f:
+                        np.lib.format.write_array(f, column)
+        finally:
+            for part in parts:
+                part.close()
+        os.replace(tmp_filename, self.filename)
+        for part in self._parts:
+            os.remove(part)
+        self._parts = []
+
+
+class ParquetWriter(ColumnarWriter):
+    # needs pyarrow, every row_group_size slices a row group is appended to the parquet file
+    extension = ".parquet"
+
+    def __init__(self, filename, row_group_size=64):
+        import pyarrow  # noqa: F401 -> fail early if pyarrow is not installed
+        super().__init__(filename)
+        self.row_group_size = row_group_size
+        self._writer = None
+
+    def write(self, result):
+        super().write(result)
+        if len(next(iter(self.columns.values()))) >= self.row_group_size:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table(self.columns)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.filename, table.schema)
+        self._writer.write_table(table)
+        self.columns = {}
+
+    def close(self):
+        if self.columns:
+            self._write_row_group()
+        if self._writer is not None:
+            self._writer.close()
+
+
+COLUMNAR_WRITERS = {"npz": NpzWriter, "parquet": ParquetWriter}
+
+
+class MultiWriter(ResultWriter):
+    # writes every result to a csv and a json lines file and optionally to a columnar file
+    def __init__(self, filename, columnar_format=None):
+        if columnar_format is not None and columnar_format not in COLUMNAR_WRITERS:
+            raise ValueError(f"columnar_format has to be one of {list(COLUMNAR_WRITERS)}")
+        super().__init__(filename)
+        self.writers = [CsvWriter(filename), JsonLinesWriter(filename)]
+        if columnar_format is not None:
+            self.writers.append(COLUMNAR_WRITERS[columnar_format](filename))
+
+    def write(self, result):
+        for writer in self.writers:
+            writer.write(result)
+        self.n_rows += 1
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 import numpy as np
 import SimpleITK as sitk
 import torch
@@ -14,19 +16,77 @@ transpose((1,2,0)) from sitk to numpy for the saggital view
 transpose((2,0,1)) form numpy to sitk 
 """
 
+"""
+The numpy representation (np_data) is computed once and cached until a new image is set via data.
+If the image already has the pixel type np_dtype, np_data is a read-only view of the SimpleITK buffer, else a
+read-only converted copy.
+
+Writes via img[...] = value go into a numpy buffer which is shared with np_data. In the default mode the buffer is
+written back to the SimpleITK image after each write. In the mutable mode (mutable=True) it is only written back
+when the SimpleITK image is needed again (data), min and max are computed on the edited buffer without writing it
+back. batch_edit() does the same for a block of writes:
+    with img.batch_edit():
+        for x, y, z in voxels:
+            img[x, y, z] = 1
+"""
+
+
+# DICOM tags of the header
+HEADER_TAGS = dict(series_number="0020|0011",
+                   acquisition_date="0008|0022",
+                   patient_ID="0010|0020",
+                   patient_birthdate="0010|0030",
+                   patient_sex="0010|0040",
+                   patient_size="0010|1020",
+                   patient_weight="0010|1030",
+                   scl_slope="0028|1053",
+                   scl_inter="0028|1052",
+                   flip_angle="0018|1314",
+                   )
+
+
+class _ImageBuffer:
+    # exposes the pixel buffer of a SimpleITK image to numpy and keeps the image alive as long as an array uses it
+    def __init__(self, image):
+        self.image = image
+        self.__array_interface__ = sitk.GetArrayViewFromImage(image).__array_interface__
+
+
+def _array_view(image):
+    array = np.asarray(_ImageBuffer(image))
+    array.flags.writeable = False
+    return array
+
 
 class AbstractImage:
-    def __init__(self, data=None, sequence_name="", folder_name="", slice_number=-1, shape=(1, 1, 1)):
+    np_dtype = "int16"
+
+    def __init__(self, data=None, sequence_name="", folder_name="", slice_number=-1, shape=(1, 1, 1),
+                 mutable=False):
+        self._init_state(sequence_name, folder_name, slice_number, mutable)
         if data is None:
             self.data = sitk.Image(list(shape), sitk.sitkFloat32)
         else:
             self.data = data
+
+    def _init_state(self, sequence_name="", folder_name="", slice_number=-1, mutable=False):
+        # everything but the SimpleITK image, also used by the subclasses which set the image differently
+        # (e.g. lazy_image_loader.LazyImage)
+        self.mutable = mutable
         self.folder_name = folder_name
         self.sequence_name = sequence_name
         self.slice_number = slice_number
+        self._reset_state()
+
+    def _reset_state(self):
+        # the numpy views of the SimpleITK image, reset when the image is replaced
+        self._np_cache = None
+        self._np_buffer = None
+        self._dirty = False
 
     @property
     def data(self):
+        self._sync()
         return self._data
 
     @data.setter
@@ -40,51 +100,101 @@ class AbstractImage:
             self._data = x
         else:
             raise ValueError("The setter function is implemented for numpy and sitk only")
+        self._reset_state()
         self.update_infos()
 
     @property
-    def np_data(self, dtype="int16"):
-        return sitk.GetArrayFromImage(self._data).astype(dtype).transpose((1, 2, 0))  # to saggital view
+    def np_data(self):
+        if self._np_cache is None:
+            array = _array_view(self._data)
+            if array.dtype != self.np_dtype:
+                array = array.astype(self.np_dtype)
+                array.flags.writeable = False
+            self._np_cache = array.transpose((1, 2, 0))  # to saggital view
+        return self._np_cache
+
+    def copy_to(self, out):
+        # writes np_data into the preallocated array out with a single copy, including the conversion to np_dtype
+        if self._np_cache is None:
+            source = _array_view(self.data).transpose((1, 2, 0))
+        else:
+            source = self._np_cache
+        np.copyto(out, source, casting="unsafe")
+        return out
 
     @property
     def torch_data(self):
-        return torch.from_numpy(self.np_data).permute(2, 1, 0)
+        # np_data is read-only, torch needs its own copy
+        return torch.from_numpy(self.np_data.copy()).permute(2, 1, 0)
 
     def __getitem__(self, *args, **kwargs):
         return self.np_data.__getitem__(*args, **kwargs)
 
     def __setitem__(self, *args, **kwargs):
-        np_temp = self.np_data.copy()
-        np_temp.__setitem__(*args, **kwargs)
-        self.data = np_temp
+        self._writable_np_data().__setitem__(*args, **kwargs)
+        self._dirty = True
+        if not self.mutable:
+            self._sync()
+
+    def _writable_np_data(self):
+        # the buffer is in the SimpleITK order (z, y, x) and is created once, np_data becomes a read-only view of it
+        if self._np_buffer is None:
+            self._np_buffer = sitk.GetArrayFromImage(self._data).astype(self.np_dtype, copy=False)
+            self._np_cache = self._np_buffer.transpose((1, 2, 0)).view()
+            self._np_cache.flags.writeable = False
+        return self._np_buffer.transpose((1, 2, 0))
+
+    def _sync(self):
+        # write the edited numpy buffer back into a SimpleITK image with the same geometry and meta data
+        if not self._dirty:
+            return
+        sitk_image = sitk.GetImageFromArray(self._np_buffer, isVector=False)
+        sitk_image.CopyInformation(self._data)
+        for key in self._data.GetMetaDataKeys():
+            sitk_image.SetMetaData(key, self._data.GetMetaData(key))
+        self._data = sitk_image
+        self._dirty = False
+
+    @contextmanager
+    def batch_edit(self):
+        # all writes in the block are written back to the SimpleITK image once at the end
+        mutable = self.mutable
+        self.mutable = True
+        try:
+            yield self
+        finally:
+            self.mutable = mutable
+            if not mutable:
+                self._sync()
+
+    def _min_max(self):
+        # on the numpy buffer if it exists (it has all edits, also the ones not yet written back in the mutable mode),
+        # else computed by SimpleITK on its own buffer
+        if self._np_buffer is not None:
+            return np.array([self._np_buffer.min(), self._np_buffer.max()])
+        # converted like np_data
+        min_max_filter = sitk.MinimumMaximumImageFilter()
+        min_max_filter.Execute(self._data)
+        return np.array([min_max_filter.GetMinimum(), min_max_filter.GetMaximum()]).astype(self.np_dtype)
 
     @property
     def max(self):
-        return self.np_data.max()
+        return self._min_max()[1]
 
     @property
     def min(self):
-        return self.np_data.min()
+        return self._min_max()[0]
 
     @property
     def header(self):
-        keys = self.GetMetaDataKeys()
+        keys = set(self.GetMetaDataKeys())
         pixel_spacing = self.GetSpacing()
         header = dict(folder_name=self.folder_name,
                       slice_number=None,
                       sequence_name=self.sequence_name,
                       pixdim=[1.0] + list(pixel_spacing) + [.0, .0, .0, .0],
-                      series_number=self.GetMetaData("0020|0011") if "0020|0011" in keys else None,
-                      acquisition_date=self.GetMetaData("0008|0022") if "0008|0022" in keys else None,
-                      patient_ID=self.GetMetaData("0010|0020") if "0010|0020" in keys else None,
-                      patient_birthdate=self.GetMetaData("0010|0030") if "0010|0030" in keys else None,
-                      patient_sex=self.GetMetaData("0010|0040") if "0010|0040" in keys else None,
-                      patient_size=self.GetMetaData("0010|1020") if "0010|1020" in keys else None,
-                      patient_weight=self.GetMetaData("0010|1030") if "0010|1030" in keys else None,
-                      scl_slope=self.GetMetaData("0028|1053") if "0028|1053" in keys else None,
-                      scl_inter=self.GetMetaData("0028|1052") if "0028|1052" in keys else None,
-                      flip_angle=self.GetMetaData("0018|1314") if "0018|1314" in keys else None,
                       )
+        header.update({name: self.GetMetaData(tag) if tag in keys else None for name, tag in HEADER_TAGS.items()})
         return header
 
     def update_infos(self, folder_name=None, sequence_name=None):
@@ -0,0 +1,39 @@
+import time
+from functools import lru_cache
+
+from memoization import memoize
+
+
+def square(num):
+    return num ** 2
+
+
+def lookup_time(function, keys, repeat=5):
+    # best time per call in ns, all keys are cached before the measurement -> only hits are timed
+    for k in keys:
+        function(k)
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for k in keys:
+            function(k)
+        durations.append(time.perf_counter() - start)
+    return min(durations) / len(keys) * 1e9
+
+
+def benchmark_lookup(n_keys=1000, n_calls=100000):
+    keys = [i % n_keys for i in range(n_calls)]
+    cases = {
+        "uncached": square,
+        "functools.lru_cache": lru_cache(maxsize=n_keys)(square),
+        "memoize": memoize(maxsize=n_keys)(square),
+        "memoize, ttl": memoize(maxsize=n_keys, ttl=3600)(square),
+        "memoize, max_bytes": memoize(maxsize=n_keys, max_bytes=2 ** 20)(square),
+        "memoize, arg_keys": memoize(maxsize=n_keys, arg_keys={"num": int})(square),
+    }
+    for name, function in cases.items():
+        print(f"{name}: {lookup_time(function, keys):.0f} ns per call")
+
+
+if __name__ == "__main__":
+    benchmark_lookup()
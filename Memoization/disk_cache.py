@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from memoization import _MISSING, LRUCache
+
+"""
+Persistent cache tier in a local SQLite file which can be shared by several processes:
+    disk = DiskCache("cache.sqlite", namespace="compute", max_bytes=10 * 2 ** 30)
+    @memoize(cache=TieredCache(LRUCache(maxsize=1000), disk))
+    def compute(num):
+        ...
+TieredCache looks into the in-memory LRUCache first, then into the DiskCache, and fills the memory tier with
+the values found on disk. SQLite takes care of the locking between the processes (WAL mode: readers do not block
+the writer), the least recently used entries are removed when the values exceed max_bytes.
+The values are serialized by a codec, NumpyCodec stores numpy arrays as their raw buffer and reads them back
+as arrays on the buffer read from the database, without further copies. Everything else is pickled.
+"""
+
+
+class PickleCodec:
+    name = "pickle"
+
+    def encode(self, value):
+        # -> (meta data as json serializable object, buffer)
+        return None, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, meta, buffer):
+        return pickle.loads(buffer)
+
+
+class NumpyCodec(PickleCodec):
+    name = "numpy"
+
+    def encode(self, value):
+        np = _numpy()
+        if np is not None and type(value) is np.ndarray and value.dtype.hasobject is False:
+            value = np.ascontiguousarray(value)
+            # memoryview -> sqlite3 stores the array buffer without building a bytes copy first
+            return dict(dtype=value.dtype.str, shape=value.shape), memoryview(value).cast("B")
+        return super().encode(value)
+
+    def decode(self, meta, buffer):
+        if meta is None:
+            return super().decode(meta, buffer)
+        # a read-only array on the bytes read from the database
+        return _numpy().frombuffer(buffer, dtype=meta["dtype"]).reshape(meta["shape"])
+
+
+def _numpy():
+    # numpy is optional for the cache
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class DiskCache:
+    def __init__(self, filename, namespace="", max_bytes=2 ** 30, ttl=None, codec=None, timeout=30.0):
+        self.filename = filename
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.codec = codec or NumpyCodec()
+        self.codecs = {codec.name: codec for codec in [PickleCodec(), NumpyCodec(), self.codec]}
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("""CREATE TABLE IF NOT EXISTS cache(
+                                      key TEXT PRIMARY KEY,
+                                      codec TEXT,
+                                      meta TEXT,
+                                      value BLOB,
+                                      size INTEGER,
+                                      access_time REAL,
+                                      expiry REAL
+                                      )""")
+                connection.execute("CREATE INDEX IF NOT EXISTS cache_access_time ON cache(access_time)")
+
+    def _connect(self):
+        # one connection per process, a connection inherited by fork must not be used
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.filename, timeout=self.timeout, check_same_thread=False,
+                                               isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._connection
+
+    def _key(self, key):
+        return hashlib.sha256(pickle.dumps((self.namespace, key), protocol=4)).hexdigest()
+
+    def get(self, key, default=_MISSING, count=True):
+        return self.get_with_expiry(key, default, count)[0]
+
+    def get_with_expiry(self, key, default=_MISSING, count=True):
+        # -> (value, expiry time (time.time()) or None), (default, None) if the key is not cached
+        db_key = self._key(key)
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT codec, meta, value, expiry FROM cache WHERE key = ?",
+                                     (db_key,)).fetchone()
+            if row is not None and row[3] is not None and row[3] <= time.time():
+                connection.execute("DELETE FROM cache WHERE key = ?", (db_key,))
+                self.expirations += 1
+                row = None
+            if row is None:
+                self.misses += count
+                return default, None
+            connection.execute("UPDATE cache SET access_time = ? WHERE key = ?", (time.time(), db_key))
+            self.hits += count
+
+        codec, meta, value, expiry = row
+        return self.codecs[codec].decode(json.loads(meta), value), expiry
+
+    def put(self, key, value, ttl=None):
+        meta, buffer = self.codec.encode(value)
+        size = len(buffer) if not isinstance(buffer, memoryview) else buffer.nbytes
+        if size > self.max_bytes:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expiry = time.time() + ttl if ttl is not None else None
+
+        with self._lock:
+            connection = self._connect()
+            # BEGIN IMMEDIATE takes the write lock of the database -> the size check and the eviction are not
+            # interleaved with other processes
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   (self._key(key), self.codec.name, json.dumps(meta), buffer, size, time.time(),
+                                    expiry))
+                self._evict(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def _evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in connection.execute("SELECT key, size FROM cache ORDER BY access_time").fetchall():
+            connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM cache")
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def info(self):
+        with self._lock:
+            n_entries, n_bytes = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        requests = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions, expirations=self.expirations,
+                    hit_rate=self.hits / requests if requests else 0.0, size=n_entries, bytes=n_bytes)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+class TieredCache:
+    # in-memory LRU cache in front of a DiskCache, same interface as LRUCache
+    def __init__(self, memory=None, disk=None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.disk = disk
+
+    def get(self, key, default=_MISSING, count=True):
+        value = self.memory.get(key, _MISSING, count)
+        if value is _MISSING:
+            value, expiry = self.disk.get_with_expiry(key, _MISSING, count)
+            if value is _MISSING:
+                return default
+            # the entry expires in memory when it expires on disk
+            self.memory.put(key, value, expiry - time.time() if expiry is not None else None)
+        return value
+
+    def count_coalesced(self):
+        # the waiting call missed both tiers, its value is counted as a hit of the memory tier
+        self.memory.count_coalesced()
+
+    def put(self, key, value, ttl=None):
+        self.memory.put(key, value, ttl)
+        self.disk.put(key, value, ttl)
+
+    def clear(self):
+        self.memory.clear()
+        self.disk.clear()
+
+    def __len__(self):
+        return len(self.disk)
+
+    def info(self):
+        return dict(memory=self.memory.info(), disk=self.disk.info())
@@ -1,25 +1,316 @@
+import asyncio
+import inspect
+import sys
+import threading
 import time
+from collections import OrderedDict
+from functools import wraps
 
-cache = {}
+"""
+Memoization decorator with a bounded cache:
+    @memoize(maxsize=1000, ttl=3600, max_bytes=2 ** 30)
+    def compute(num):
+        ...
+- maxsize: max. number of entries, max_bytes: max. approximate size of all values, the least recently used entries
+  are evicted first
+- ttl: time (in seconds) after which an entry expires
+- key: function(*args, **kwargs) -> hashable key of a call, arg_keys: {argument name: function(value) -> hashable}
+  e.g. to use the id of an image instead of the image itself as key
+- cache: object with the interface of LRUCache used instead of a new LRUCache, e.g. a disk_cache.TieredCache
+The cache is thread safe, compute.cache_info() gives the hit/miss/eviction counters, compute.cache_clear() empties it.
 
-def compute(num):
-    if num in cache:
-        return cache[num]
+The decorator also works for async def functions. Concurrent calls with the same uncached key are coalesced
+(single_flight=True): the first caller computes the value, the other threads/tasks wait for its result or exception
+and are counted as hits (and as coalesced). If the computing task is cancelled, a waiting task takes over.
+cache_exceptions=True also caches exceptions (for exception_ttl seconds) and raises them again on a hit.
+"""
+
+_MISSING = object()
+
+
+class _KWD_MARK:
+    # separates the positional from the keyword arguments in the default keys
+    # (a class is pickled by its name -> the same key for the disk cache in every process)
+    pass
+
+
+class _CachedException:
+    # marks a cached exception, raised again on a hit
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def _unwrap(value):
+    if isinstance(value, _CachedException):
+        raise value.exception
+    return value
+
+
+class _LeaderCancelled(Exception):
+    # the task computing the value was cancelled -> a waiting task takes over the computation
+    pass
+
+
+class _Flight:
+    # a computation in progress which other threads wait for
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+def approximate_size(value):
+    # numpy arrays (and similar) know the size of their data, sys.getsizeof only counts the object itself
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes + sys.getsizeof(value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    def __init__(self, maxsize=128, ttl=None, max_bytes=None, sizeof=approximate_size, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.timer = timer
+
+        # key -> (value, size, expiry time), the least recently used entry comes first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def get(self, key, default=_MISSING, count=True):
+        # count=False: the lookup is not counted as hit/miss
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= self.timer():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += count
+                return default
+            self._entries.move_to_end(key)
+            self.hits += count
+            return entry[0]
+
+    def count_coalesced(self):
+        # a lookup counted as miss got its value from a computation in progress -> counted as hit
+        with self._lock:
+            self.misses -= 1
+            self.hits += 1
+            self.coalesced += 1
+
+    def put(self, key, value, ttl=None):
+        # ttl overrides the ttl of the cache for this entry
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # would evict everything else
+        ttl = self.ttl if ttl is None else ttl
+        expiry = self.timer() + ttl if ttl is not None else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expiry)
+            self._bytes += size
+            while ((self.maxsize is not None and len(self._entries) > self.maxsize) or
+                   (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
 
+    def __len__(self):
+        return len(self._entries)
+
+    def info(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions, expirations=self.expirations,
+                        coalesced=self.coalesced, hit_rate=self.hits / requests if requests else 0.0,
+                        size=len(self._entries), bytes=self._bytes)
+
+
+def _make_key_function(function, key=None, arg_keys=None):
+    if key is not None:
+        return key
+    if not arg_keys:
+        # like functools: positional and keyword arguments, the keywords in a fixed order after a marker
+        # -> f(1, ('y', 2)) and f(1, y=2) have different keys
+        def default_key(*args, **kwargs):
+            return args + (_KWD_MARK,) + tuple(sorted(kwargs.items())) if kwargs else args
+        return default_key
+
+    signature = inspect.signature(function)
+
+    def argument_key(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return tuple((name, arg_keys[name](value) if name in arg_keys else value)
+                     for name, value in bound.arguments.items())
+    return argument_key
+
+
+def memoize(maxsize=128, ttl=None, max_bytes=None, key=None, arg_keys=None, sizeof=approximate_size,
+            single_flight=True, cache_exceptions=False, exception_ttl=None, cache=None):
+    def decorator(function):
+        function_cache = cache if cache is not None else LRUCache(maxsize, ttl, max_bytes, sizeof)
+        make_key = _make_key_function(function, key, arg_keys)
+        flights = {}  # key -> _Flight of the threads, (event loop, key) -> asyncio.Future of the tasks
+        flights_lock = threading.Lock()
+
+        def count_coalesced():
+            # caches without count_coalesced (cache=...) count the waiting calls as misses
+            if hasattr(function_cache, "count_coalesced"):
+                function_cache.count_coalesced()
+
+        def store_exception(k, exception):
+            if cache_exceptions and isinstance(exception, Exception):
+                function_cache.put(k, _CachedException(exception), exception_ttl)
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            k = make_key(*args, **kwargs)
+            if not single_flight:
+                result = function_cache.get(k)
+                if result is _MISSING:
+                    try:
+                        result = function(*args, **kwargs)
+                    except Exception as e:
+                        store_exception(k, e)
+                        raise
+                    function_cache.put(k, result)
+                return _unwrap(result)
+
+            result = function_cache.get(k)
+            if result is not _MISSING:
+                return _unwrap(result)
+
+            # look again, the value may have been stored in the meantime, and register the computation
+            # without interleaving with other threads
+            with flights_lock:
+                result = function_cache.get(k, count=False)
+                flight = flights.get(k) if result is _MISSING else None
+                leader = result is _MISSING and flight is None
+                if leader:
+                    flight = flights[k] = _Flight()
+            if result is not _MISSING:
+                return _unwrap(result)
+
+            if not leader:
+                flight.event.wait()
+                count_coalesced()
+                if flight.exception is not None:
+                    raise flight.exception
+                return flight.result
+
+            try:
+                flight.result = function(*args, **kwargs)
+                function_cache.put(k, flight.result)
+                return flight.result
+            except BaseException as e:
+                flight.exception = e
+                store_exception(k, e)
+                raise
+            finally:
+                with flights_lock:
+                    del flights[k]
+                flight.event.set()
+
+        @wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            k = make_key(*args, **kwargs)
+            result = function_cache.get(k)
+            if result is not _MISSING:
+                return _unwrap(result)
+            if not single_flight:
+                try:
+                    result = await function(*args, **kwargs)
+                except Exception as e:
+                    store_exception(k, e)
+                    raise
+                function_cache.put(k, result)
+                return result
+
+            # the tasks of one event loop run one at a time -> no lock needed
+            loop = asyncio.get_running_loop()
+            flight_key = (loop, k)
+            future = flights.get(flight_key)
+            while future is not None:
+                try:
+                    # shield: a cancelled waiter does not cancel the computation for the others
+                    result = await asyncio.shield(future)
+                except _LeaderCancelled:
+                    # the first waiter computes the value, the others wait for it
+                    future = flights.get(flight_key)
+                    continue
+                except Exception:
+                    count_coalesced()
+                    raise
+                count_coalesced()
+                return result
+
+            future = flights[flight_key] = loop.create_future()
+            try:
+                result = await function(*args, **kwargs)
+            except asyncio.CancelledError:
+                # cancelling the future would cancel the waiting tasks too
+                future.set_exception(_LeaderCancelled())
+                future.exception()
+                raise
+            except BaseException as e:
+                store_exception(k, e)
+                future.set_exception(e)
+                future.exception()  # mark as retrieved -> no warning if nobody was waiting
+                raise
+            else:
+                function_cache.put(k, result)
+                future.set_result(result)
+                return result
+            finally:
+                del flights[flight_key]
+
+        wrapper = async_wrapper if inspect.iscoroutinefunction(function) else wrapper
+        wrapper.cache = function_cache
+        wrapper.cache_info = function_cache.info
+        wrapper.cache_clear = function_cache.clear
+        return wrapper
+    return decorator
+
+
+@memoize(maxsize=128)
+def compute(num):
     print('Computing {}...'.format(num))
     time.sleep(1)
     result = num ** 2
-    cache[num] = result
     return result
 
-result = compute(4)
-print(result)
 
-result = compute(10)
-print(result)
+if __name__ == "__main__":
+    result = compute(4)
+    print(result)
+
+    result = compute(10)
+    print(result)
+
+    result = compute(4)
+    print(result)
 
-result = compute(4)
-print(result)
+    result = compute(10)
+    print(result)
 
-result = compute(10)
-print(result)
\ No newline at end of file
+    print(compute.cache_info())
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from sql_alchemy_async import MemberRepository
+from sql_alchemy_db import Base, Member, QueryCounter, add_addresses_bulk, add_members_bulk, get_addresses
+
+"""
+Insertion of members into a database file: one commit per object (like add_member), add_all with one commit and
+bulk_insert (Core INSERT batches), and listing addresses with lazy loading of their members (N + 1 queries)
+vs. selectinload / joinedload.
+The insertion with one commit per object is measured on fewer members and extrapolated.
+Throughput of concurrent find_by_firstname requests: sync sessions in threads (asyncio.to_thread) vs. the async
+repository of sql_alchemy_async.
+"""
+
+
+def new_session(folder, name):
+    engine = create_engine(f"sqlite:///{os.path.join(folder, name)}")
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine)()
+
+
+def member_rows(n_members):
+    return ({'first_name': f"first_{i}", 'last_name': f"last_{i % 1000}", 'fidelity_credit': i % 500}
+            for i in range(n_members))
+
+
+def benchmark_insert(n_members=100000, n_members_per_commit=2000, batch_size=10000):
+    with tempfile.TemporaryDirectory() as folder:
+        cases = [
+            ("add + commit per member", n_members_per_commit,
+             lambda session, n: [(session.add(Member(**row)), session.commit()) for row in member_rows(n)]),
+            ("add_all + one commit", n_members,
+             lambda session, n: (session.add_all(Member(**row) for row in member_rows(n)), session.commit())),
+            (f"add_members_bulk, batch_size={batch_size}", n_members,
+             lambda session, n: add_members_bulk(session, member_rows(n), batch_size)),
+        ]
+        for i, (name, n, insert) in enumerate(cases):
+            engine, session = new_session(folder, f"insert_{i}.db")
+            start = time.perf_counter()
+            insert(session, n)
+            duration = time.perf_counter() - start
+            assert session.query(Member).count() == n
+            session.close()
+            engine.dispose()
+            print(f"{name}: {n} members in {duration:.2f} s, {n / duration:,.0f} members/s")
+
+
+def benchmark_eager_loading(n_members=100000, n_addresses=10000):
+    with tempfile.TemporaryDirectory() as folder:
+        engine, session = new_session(folder, "addresses.db")
+        add_members_bulk(session, member_rows(n_members))
+        add_addresses_bulk(session, ({'post_code': f"{i:05d}", 'member_id': 1 + i * (n_members // n_addresses)}
+                                     for i in range(n_addresses)))
+        for eager in [None, "selectin", "joined"]:
+            # a new session for each case -> no members in the identity map
+            session.close()
+            with QueryCounter(engine) as counter:
+                start = time.perf_counter()
+                text = repr(get_addresses(session, eager))
+                duration = time.perf_counter() - start
+            assert text.count("Address(") == n_addresses
+            print(f"listing {n_addresses} addresses, eager={eager}: {counter.count} queries, {duration:.2f} s")
+        session.close()
+        engine.dispose()
+
+
+async def run_requests(request, first_names, concurrency):
+    # -> requests per second, at most concurrency requests at the same time
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(first_name):
+        async with semaphore:
+            return await request(first_name)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[bounded(first_name) for first_name in first_names])
+    assert all(len(result) == 1 for result in results)
+    return len(first_names) / (time.perf_counter() - start)
+
+
+async def compare_sync_async(filename, n_members, n_requests, concurrency):
+    engine = create_engine(f"sqlite:///{filename}", pool_size=concurrency)
+    Base.metadata.create_all(engine)
+    sessions = sessionmaker(bind=engine)
+    with sessions() as session:
+        add_members_bulk(session, member_rows(n_members))
+    first_names = [f"first_{random.randrange(n_members)}" for _ in range(n_requests)]
+
+    def sync_request(first_name):
+        # one session per request, sessions must not be shared between threads
+        # the same query as the async repository, Member.find_by_firstname would answer from its cache
+        with sessions() as session:
+            return session.scalars(select(Member).filter_by(first_name=first_name)).all()
+
+    throughput = await run_requests(lambda first_name: asyncio.to_thread(sync_request, first_name), first_names,
+                                    concurrency)
+    print(f"sync sessions in threads: {throughput:,.0f} requests/s")
+    engine.dispose()
+
+    repository = await MemberRepository.open(f"sqlite+aiosqlite:///{filename}", pool_size=concurrency)
+    throughput = await run_requests(repository.find_by_firstname, first_names, concurrency)
+    print(f"async repository: {throughput:,.0f} requests/s")
+    await repository.close()
+
+
+def benchmark_async(n_members=10000, n_requests=2000, concurrency=32):
+    with tempfile.TemporaryDirectory() as folder:
+        asyncio.run(compare_sync_async(os.path.join(folder, "members.db"), n_members, n_requests, concurrency))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="SQLAlchemy benchmark parameters")
+    parser.add_argument("--n_members", type=int, default=100000)
+    parser.add_argument("--n_addresses", type=int, default=10000)
+    parser.add_argument("--benchmark", choices=["insert", "async"], default="insert")
+    args = parser.parse_args()
+
+    if args.benchmark == "insert":
+        benchmark_insert(args.n_members)
+        benchmark_eager_loading(args.n_members, args.n_addresses)
+    else:
+        benchmark_async()
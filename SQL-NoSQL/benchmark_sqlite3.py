@@ -0,0 +1,222 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+import sqlite3_db as db
+from sqlite3_db import SELECT_BY_LASTNAME, UPDATE_FIDELITY_CREDIT, Member, create_indexes, open_database
+from query_cache import QueryCache
+from sqlite3_pool import MemberStore
+
+"""
+Insertion of members into a database file: one transaction per row (insert_member), one executemany over dicts
+(insert_several_members) and insert_members_bulk with different batch sizes and pragma profiles.
+The per row insertion is measured on fewer rows (each commit waits for the disk) and extrapolated.
+Lookup latency of get_members_by_lastname / update_fidelity_credit for 10k to 10M rows, with and without index.
+Mixed read/write load from several threads: one connection shared with a lock vs. MemberStore (pool + writer).
+Repeated lookups of popular last names with some writes, without and with the query cache.
+"""
+
+
+def members(n_rows):
+    return (Member(f"first_{i}", f"last_{i % 10000}", i % 500) for i in range(n_rows))
+
+
+def use_database(filename, profile="default", cache_size=0):
+    # the functions of sqlite3_db work on the module connection, cursor and cache
+    # (no cache by default -> the database is measured)
+    db.connection = open_database(filename, profile)
+    db.c = db.connection.cursor()
+    db.member_cache = QueryCache(cache_size)
+    return db.connection
+
+
+def run(name, n_rows, insert, filename, profile="default"):
+    if os.path.exists(filename):
+        os.remove(filename)
+    connection = use_database(filename, profile)
+    start = time.perf_counter()
+    insert(n_rows)
+    duration = time.perf_counter() - start
+    assert connection.execute("SELECT COUNT(*) FROM members").fetchone()[0] == n_rows
+    connection.close()
+    print(f"{name}: {n_rows} rows in {duration:.2f} s, {n_rows / duration:,.0f} rows/s")
+
+
+def per_row(n_rows):
+    for m in members(n_rows):
+        db.insert_member(m)
+
+
+def benchmark_insert(n_rows=1000000, n_rows_per_row=2000, batch_sizes=(1000, 10000, 100000)):
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, "members.db")
+        run("insert_member (one transaction per row)", n_rows_per_row, per_row, filename)
+        run("insert_several_members (executemany over dicts)", n_rows,
+            lambda n: db.insert_several_members(list(members(n))), filename)
+        for profile in ["default", "ingest"]:
+            for batch_size in batch_sizes:
+                run(f"insert_members_bulk, batch_size={batch_size}, profile={profile}", n_rows,
+                    lambda n: db.insert_members_bulk(members(n), batch_size), filename, profile)
+        # without creating Member objects
+        run("insert_members_bulk, tuples, batch_size=10000, profile=ingest", n_rows,
+            lambda n: db.insert_members_bulk(((f"first_{i}", f"last_{i % 10000}", i % 500) for i in range(n))),
+            filename, "ingest")
+
+
+def lookup_latency(function, arguments):
+    # -> mean latency in ms
+    start = time.perf_counter()
+    for args in arguments:
+        function(*args)
+    return (time.perf_counter() - start) / len(arguments) * 1000
+
+
+def benchmark_lookup(sizes=(10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7), n_lookups=1000, n_scans=5):
+    with tempfile.TemporaryDirectory() as folder:
+        for n_rows in sizes:
+            filename = os.path.join(folder, f"members_{n_rows}.db")
+            connection = use_database(filename, "ingest")
+            db.drop_indexes(connection)
+            n_names = max(n_rows // 10, 1)
+            db.insert_members_bulk((f"first_{i}", f"last_{i % n_names}", i % 500) for i in range(n_rows))
+
+            lookups = [(f"last_{random.randrange(n_names)}",) for _ in range(n_lookups)]
+            updates = [(Member(f"first_{i}", f"last_{i % n_names}", 0), 1)
+                       for i in random.sample(range(n_rows), n_lookups)]
+            # full table scans are slow -> fewer lookups
+            scan = lookup_latency(db.get_members_by_lastname, lookups[:n_scans])
+            start = time.perf_counter()
+            create_indexes(connection)
+            index_time = time.perf_counter() - start
+            db.check_query_plans()
+            select = lookup_latency(db.get_members_by_lastname, lookups)
+            update = lookup_latency(db.update_fidelity_credit, updates)
+            print(f"{n_rows} rows: get_members_by_lastname {scan:.3f} ms without index, {select:.3f} ms with "
+                  f"index, update_fidelity_credit {update:.3f} ms with index (creating the index: "
+                  f"{index_time:.1f} s)")
+            connection.close()
+
+
+class LockedConnection:
+    # one connection for all threads, a lock around every statement (what the module connection would need)
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def get_members_by_lastname(self, last_name):
+        with self.lock:
+            return self.connection.execute(SELECT_BY_LASTNAME, {'last_name': last_name}).fetchall()
+
+    def update_fidelity_credit(self, m, fidelity_credit):
+        with self.lock, self.connection:
+            self.connection.execute(UPDATE_FIDELITY_CREDIT, {
+                'first_name': m.first_name, 'last_name': m.last_name, 'fidelity_credit': fidelity_credit})
+
+    def close(self):
+        self.connection.close()
+
+
+def mixed_load(store, n_names, n_rows, n_readers=8, n_writers=4, duration=5.0):
+    # -> read latencies (s), number of writes
+    stop = threading.Event()
+    latencies = [[] for _ in range(n_readers)]
+    n_writes = [0] * n_writers
+
+    def read(i):
+        while not stop.is_set():
+            start = time.perf_counter()
+            store.get_members_by_lastname(f"last_{random.randrange(n_names)}")
+            latencies[i].append(time.perf_counter() - start)
+
+    def write(i):
+        while not stop.is_set():
+            k = random.randrange(n_rows)
+            store.update_fidelity_credit(Member(f"first_{k}", f"last_{k % n_names}", 0), random.randrange(500))
+            n_writes[i] += 1
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(n_readers)]
+    threads += [threading.Thread(target=write, args=(i,)) for i in range(n_writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sorted(latency for thread_latencies in latencies for latency in thread_latencies), sum(n_writes)
+
+
+def benchmark_concurrency(n_rows=100000, n_readers=8, n_writers=4, duration=5.0):
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, "members.db")
+        connection = open_database(filename, "ingest")
+        n_names = n_rows // 10
+        db.insert_members_bulk(((f"first_{i}", f"last_{i % n_names}", i % 500) for i in range(n_rows)),
+                               db=connection)
+        connection.close()
+
+        for name, store in [("one connection with a lock", LockedConnection(filename)),
+                            ("MemberStore (pool, WAL, write queue)", MemberStore(filename))]:
+            latencies, n_writes = mixed_load(store, n_names, n_rows, n_readers, n_writers, duration)
+            store.close()
+            print(f"{name}: {len(latencies) / duration:,.0f} reads/s, read latency p50 "
+                  f"{1000 * latencies[len(latencies) // 2]:.2f} ms, "
+                  f"p99 {1000 * latencies[int(0.99 * len(latencies))]:.2f} ms, {n_writes / duration:,.0f} writes/s")
+
+
+def benchmark_cache(n_rows=100000, n_requests=100000, write_fraction=0.05, cache_sizes=(0, 100, 1000)):
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, "members.db")
+        n_names = n_rows // 10
+        # popular last names are requested more often (Zipf like)
+        weights = [1 / (k + 1) for k in range(n_names)]
+        requests = random.choices(range(n_names), weights, k=n_requests)
+        writes = [random.random() < write_fraction for _ in range(n_requests)]
+
+        for cache_size in cache_sizes:
+            if os.path.exists(filename):
+                os.remove(filename)
+            connection = use_database(filename, "ingest", cache_size)
+            db.insert_members_bulk((f"first_{i}", f"last_{i % n_names}", i % 500) for i in range(n_rows))
+            db.member_cache.clear()
+
+            start = time.perf_counter()
+            for k, write in zip(requests, writes):
+                if write:
+                    db.update_fidelity_credit(Member(f"first_{k}", f"last_{k}", 0), random.randrange(500))
+                else:
+                    db.get_members_by_lastname(f"last_{k}")
+            duration = time.perf_counter() - start
+
+            # the cached results are those of the database
+            for k in set(requests[:1000]):
+                cached = db.get_members_by_lastname(f"last_{k}")
+                assert cached == connection.execute(db.SELECT_BY_LASTNAME, {'last_name': f"last_{k}"}).fetchall()
+            info = db.member_cache.info()
+            print(f"cache size {cache_size}: {1e6 * duration / n_requests:.1f} us per request, "
+                  f"hit rate {info['hit_rate']:.2f}, {info['invalidations']} invalidations")
+            connection.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="sqlite3 insertion benchmark parameters")
+    parser.add_argument("--n_rows", type=int, default=1000000)
+    parser.add_argument("--n_rows_per_row", type=int, default=2000,
+                        help="Number of rows inserted with one transaction per row.")
+    parser.add_argument("--benchmark", choices=["insert", "lookup", "concurrency", "cache"], default="insert")
+    parser.add_argument("--max_rows", type=int, default=10 ** 7,
+                        help="Largest table of the lookup benchmark (powers of 10 from 10k on).")
+    args = parser.parse_args()
+
+    if args.benchmark == "insert":
+        benchmark_insert(args.n_rows, args.n_rows_per_row)
+    elif args.benchmark == "lookup":
+        sizes = [10 ** k for k in range(4, 20) if 10 ** k <= args.max_rows]
+        benchmark_lookup(sizes)
+    elif args.benchmark == "concurrency":
+        benchmark_concurrency()
+    else:
+        benchmark_cache()
@@ -0,0 +1,108 @@
+import os
+import random
+import tempfile
+import time
+
+from tinydb import Query, TinyDB
+from tinydb.middlewares import CachingMiddleware
+from tinydb.storages import JSONStorage, MemoryStorage
+
+from tinydb_index import IndexedTable, WriteBatchingMiddleware
+
+"""
+Queries of tinydb_db on tables of growing size (in memory): scanning the table (db.search) vs. the hash index on
+first_name and the sorted index on id of IndexedTable, for ==, a narrow range, update and remove.
+Every query uses another value, TinyDB would return repeated queries from its query cache.
+Inserting the documents one by one into a json file: without middleware, with CachingMiddleware and with
+WriteBatchingMiddleware.
+"""
+
+User = Query()
+
+
+def documents(n_documents, start=0):
+    return [{'id': i, 'first_name': f"first_{i % 1000}", 'last_name': f"last_{i % 100}"}
+            for i in range(start, start + n_documents)]
+
+
+def timed(function, n_repeats):
+    # -> mean duration of function(i) in ms
+    start = time.perf_counter()
+    for i in range(n_repeats):
+        function(i)
+    return (time.perf_counter() - start) / n_repeats * 1000
+
+
+def benchmark_queries(n_documents, n_repeats=10):
+    rows = documents(n_documents)
+    db = TinyDB(storage=MemoryStorage)
+    start = time.perf_counter()
+    db.insert_multiple(rows)
+    insert_duration = time.perf_counter() - start
+
+    indexed_db = TinyDB(storage=MemoryStorage)
+    table = IndexedTable(indexed_db, hash_fields=["first_name"], sorted_fields=["id"])
+    start = time.perf_counter()
+    table.insert_multiple(rows)
+    indexed_insert_duration = time.perf_counter() - start
+    print(f"{n_documents} documents, insert_multiple: {insert_duration:.2f} s, indexed {indexed_insert_duration:.2f} s")
+
+    names = [f"first_{random.randrange(1000)}" for _ in range(n_repeats)]
+    starts = [n_documents - 100 - random.randrange(100) for _ in range(n_repeats)]
+    cases = [
+        ("first_name == ...", lambda search, i: search(User.first_name == names[i]), n_documents // 1000),
+        ("id > n - 100 ...", lambda search, i: search(User.id > starts[i]), None),
+    ]
+    for name, query, n_expected in cases:
+        durations = []
+        for search in [db.search, table.search]:
+            durations.append(timed(lambda i: query(search, i), n_repeats))
+            if n_expected is not None:
+                assert len(query(search, 0)) == n_expected
+        print(f"  {name}: scan {durations[0]:.3f} ms, index {durations[1]:.3f} ms, {durations[0] / durations[1]:.0f}x")
+
+    # the same documents are changed in both tables
+    ids = random.sample(range(n_documents), n_repeats)
+    durations = [timed(lambda i: update({'last_name': "changed"}, User.id == ids[i]), n_repeats)
+                 for update in [db.update, table.update]]
+    print(f"  update id == ...: scan {durations[0]:.3f} ms, index {durations[1]:.3f} ms")
+    durations = [timed(lambda i: remove(User.id == ids[i]), n_repeats) for remove in [db.remove, table.remove]]
+    print(f"  remove id == ...: scan {durations[0]:.3f} ms, index {durations[1]:.3f} ms")
+    assert len(db) == len(table) == n_documents - n_repeats
+    assert len(table.search(User.last_name == "changed")) == 0
+
+
+def benchmark_middlewares(n_documents, n_existing=0):
+    # n_documents single inserts into a file with n_existing documents
+    storages = [("JSONStorage", JSONStorage), ("CachingMiddleware", CachingMiddleware(JSONStorage)),
+                ("WriteBatchingMiddleware", WriteBatchingMiddleware(JSONStorage, write_batch=1000))]
+    with tempfile.TemporaryDirectory() as folder:
+        for i, (name, storage) in enumerate(storages):
+            filename = os.path.join(folder, f"db_{i}.json")
+            with TinyDB(filename) as db:
+                db.insert_multiple(documents(n_existing))
+            start = time.perf_counter()
+            with TinyDB(filename, storage=storage) as db:
+                for row in documents(n_documents, n_existing):
+                    db.insert(row)
+            duration = time.perf_counter() - start
+            with TinyDB(filename) as db:
+                assert len(db) == n_existing + n_documents
+            print(f"{name}: {n_documents} inserts into {n_existing} documents in {duration:.2f} s, "
+                  f"{n_documents / duration:,.0f} inserts/s")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="TinyDB benchmark parameters")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--n_inserts", type=int, default=2000)
+    parser.add_argument("--benchmark", choices=["queries", "middlewares", "all"], default="all")
+    args = parser.parse_args()
+
+    if args.benchmark in ["queries", "all"]:
+        for n_documents in args.sizes:
+            benchmark_queries(n_documents)
+    if args.benchmark in ["middlewares", "all"]:
+        for n_existing in [0, 10000]:
+            benchmark_middlewares(args.n_inserts, n_existing)
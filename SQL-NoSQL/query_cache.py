@@ -0,0 +1,120 @@
+import threading
+from collections import OrderedDict
+
+"""
+Read-through cache for query results with precise invalidation by the write paths:
+    cache = QueryCache(maxsize=1024)
+    def get_members_by_lastname(last_name):
+        return cache.get_or_load(("get_members_by_lastname", last_name), [("last_name", last_name)],
+                                 lambda: ...query...)
+    def update_fidelity_credit(m, fidelity_credit):
+        ...write and commit...
+        cache.invalidate(("last_name", m.last_name), ("first_name", m.first_name))
+Every entry has tags (e.g. ("last_name", "Martin")): the values of the rows its result depends on. A write
+invalidates the tags of the rows it changes, with the old and the new values, after its commit -> the entries of
+all queries which could return these rows are removed.
+A result loaded while a write of one of its tags was committed is not stored (the version of each tag is checked)
+-> a read which starts after a write returned never sees a result from before the write.
+The least recently used entries are removed if there are more than maxsize entries.
+"""
+
+
+class QueryCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (result, tags), the least recently used entry first
+        self._keys = {}  # tag -> keys of the entries with this tag
+        # tag -> number of invalidations, only for the tags of loads in progress (tag -> number of loads)
+        self._versions = {}
+        self._loading = {}
+        self._clears = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, tags, load):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy(entry[0])
+            self.misses += 1
+            versions = self._tag_versions(tags)
+            for tag in tags:
+                self._loading[tag] = self._loading.get(tag, 0) + 1
+
+        try:
+            result = load()
+        except BaseException:
+            with self._lock:
+                self._loaded(tags)
+            raise
+
+        with self._lock:
+            # not stored if a write invalidated one of the tags (or cleared the cache) in the meantime
+            store = versions == self._tag_versions(tags)
+            self._loaded(tags)
+            if store and self.maxsize:
+                self._remove(key)
+                self._entries[key] = (result, tags)
+                for tag in tags:
+                    self._keys.setdefault(tag, set()).add(key)
+                while len(self._entries) > self.maxsize:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+        return _copy(result)
+
+    def _loaded(self, tags):
+        for tag in tags:
+            self._loading[tag] -= 1
+            if not self._loading[tag]:
+                del self._loading[tag]
+                self._versions.pop(tag, None)
+
+    def _tag_versions(self, tags):
+        return [self._clears] + [self._versions.get(tag, 0) for tag in tags]
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            keys = self._keys[tag]
+            keys.discard(key)
+            if not keys:
+                del self._keys[tag]
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                if tag in self._loading:
+                    self._versions[tag] = self._versions.get(tag, 0) + 1
+                for key in list(self._keys.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        # e.g. after writes whose rows are not known (bulk inserts, dropping the table)
+        with self._lock:
+            self._clears += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._keys.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def info(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses, invalidations=self.invalidations,
+                        evictions=self.evictions, hit_rate=self.hits / requests if requests else 0.0,
+                        size=len(self._entries))
+
+
+def _copy(result):
+    # the callers get their own list, changing it does not change the cached result
+    return list(result) if isinstance(result, list) else result
@@ -0,0 +1,152 @@
+import asyncio
+from itertools import islice
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+
+from sql_alchemy_db import Address, Base, Contract, Member
+
+"""
+Async access to the Member, Address and Contract tables of sql_alchemy_db (needs the aiosqlite driver):
+    repository = await MemberRepository.open("sqlite+aiosqlite:///members.db")
+    member = await repository.add_member(first_name='Mack', last_name='Dean', fidelity_credit=10)
+    members = await repository.find_by_firstname('Mack')
+    async for member in repository.stream_members():
+        ...
+    await repository.close()
+Every call uses its own AsyncSession -> the calls of concurrent tasks do not share a session. The objects are not
+expired at the commit, their attributes can be read after the call without another query.
+"""
+
+
+class MemberRepository:
+    def __init__(self, engine):
+        self.engine = engine
+        self.sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    @classmethod
+    async def open(cls, url="sqlite+aiosqlite:///members.db", **engine_kwargs):
+        # an in-memory database exists per connection -> use a file (or one connection, poolclass=StaticPool)
+        engine = create_async_engine(url, **engine_kwargs)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        return cls(engine)
+
+    async def close(self):
+        await self.engine.dispose()
+
+    # members
+    async def add_member(self, member=None, **columns):
+        member = member if member is not None else Member(**columns)
+        async with self.sessions() as session:
+            session.add(member)
+            await session.commit()
+        return member
+
+    async def add_members(self, rows, batch_size=10000):
+        # rows: dicts of column values from an iterable, read batch by batch like bulk_insert of sql_alchemy_db,
+        # one Core INSERT and one commit per batch
+        rows = iter(rows)
+        n_rows = 0
+        async with self.sessions() as session:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    return n_rows
+                await session.execute(insert(Member), batch)
+                await session.commit()
+                n_rows += len(batch)
+
+    async def get_member(self, member_id):
+        async with self.sessions() as session:
+            return await session.get(Member, member_id)
+
+    async def find_by_firstname(self, first_name):
+        async with self.sessions() as session:
+            return (await session.scalars(select(Member).filter_by(first_name=first_name))).all()
+
+    async def count_members(self):
+        async with self.sessions() as session:
+            return await session.scalar(select(func.count()).select_from(Member))
+
+    async def update_fidelity_credit(self, member_id, fidelity_credit):
+        async with self.sessions() as session:
+            await session.execute(update(Member).where(Member.id == member_id)
+                                  .values(fidelity_credit=fidelity_credit))
+            await session.commit()
+
+    async def remove_member(self, member_id):
+        # the addresses and contracts of the member are removed too
+        async with self.sessions() as session:
+            await session.execute(delete(Address).where(Address.member_id == member_id))
+            await session.execute(delete(Contract).where(Contract.member_id == member_id))
+            await session.execute(delete(Member).where(Member.id == member_id))
+            await session.commit()
+
+    async def stream_members(self, batch_size=1000, **filters):
+        # async iterator over the members, fetched batch_size rows at a time instead of loading the whole result
+        async with self.sessions() as session:
+            result = await session.stream_scalars(
+                select(Member).filter_by(**filters).execution_options(yield_per=batch_size))
+            async for member in result:
+                yield member
+
+    # addresses and contracts, the member is loaded with them (lazy loading is not possible with asyncio)
+    async def add_address(self, member_id, **columns):
+        address = Address(member_id=member_id, **columns)
+        async with self.sessions() as session:
+            session.add(address)
+            await session.commit()
+        return address
+
+    async def get_addresses(self, member_id=None):
+        query = select(Address).options(selectinload(Address.member))
+        if member_id is not None:
+            query = query.where(Address.member_id == member_id)
+        async with self.sessions() as session:
+            return (await session.scalars(query)).all()
+
+    async def add_contract(self, member_id, name):
+        contract = Contract(member_id=member_id, name=name)
+        async with self.sessions() as session:
+            session.add(contract)
+            await session.commit()
+        return contract
+
+    async def get_contracts(self, member_id):
+        query = select(Contract).options(selectinload(Contract.member)).where(Contract.member_id == member_id)
+        async with self.sessions() as session:
+            return (await session.scalars(query)).all()
+
+
+async def main():
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as folder:
+        repository = await MemberRepository.open(f"sqlite+aiosqlite:///{os.path.join(folder, 'members.db')}")
+        member = await repository.add_member(first_name='Mack', last_name='Dean', fidelity_credit=10)
+        await repository.add_address(member.id, post_code='12345')
+        await repository.add_contract(member.id, 'premium')
+        await repository.add_members({'first_name': f"first_{i}", 'last_name': 'Doe', 'fidelity_credit': i}
+                                     for i in range(10000))
+
+        # concurrent requests
+        print(await asyncio.gather(repository.find_by_firstname('Mack'), repository.get_addresses(member.id),
+                                   repository.get_contracts(member.id)))
+        await repository.update_fidelity_credit(member.id, 20)
+        print((await repository.get_member(member.id)).fidelity_credit)
+
+        n_members = 0
+        async for _ in repository.stream_members(last_name='Doe'):
+            n_members += 1
+        print(n_members, await repository.count_members())
+
+        await repository.remove_member(member.id)
+        print(await repository.find_by_firstname('Mack'))
+        await repository.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,17 +1,41 @@
 import os, sys
+import weakref
+from itertools import chain, islice
 from sqlalchemy import Column, ForeignKey, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import (Session, attributes, column_property, joinedload, make_transient_to_detached,
+                            selectinload, sessionmaker)
+
+from query_cache import QueryCache
 
 Base = declarative_base()
+
+# results of Member.find_by_firstname, one cache per database, invalidated for the first names of the members
+# changed by a session
+member_caches = {}  # (backend, host, port, database) -> QueryCache
+_memory_member_caches = weakref.WeakKeyDictionary()  # engine of an in-memory SQLite database -> QueryCache
+
+def get_member_cache(bind):
+    # the cache of the database of an engine (or connection): shared by the engines of the same database, e.g. the
+    # sync and the async engine of a file, an in-memory SQLite database exists only for its engine
+    engine = bind.engine
+    url = engine.url
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        if engine not in _memory_member_caches:
+            _memory_member_caches[engine] = QueryCache(maxsize=1024)
+        return _memory_member_caches[engine]
+    database = os.path.abspath(url.database) if url.get_backend_name() == "sqlite" else url.database
+    return member_caches.setdefault((url.get_backend_name(), url.host, url.port, database), QueryCache(maxsize=1024))
+
 # define a class whose instances you want to store with sql
 class Member(Base):
     __tablename__ = 'member'
 
     id = Column(Integer, primary_key=True)
-    first_name = Column(String(250), nullable=False)
+    # active_history: the old first name is loaded when it is changed -> the cached results of both names are invalidated
+    first_name = column_property(Column(String(250), nullable=False), active_history=True)
     last_name = Column(String(250), nullable=False)
     fidelity_credit = Column(Integer, primary_key=False)
 
@@ -24,7 +48,28 @@ class Member(Base):
     
     @classmethod
     def find_by_firstname(cls, session, first_name):
-        return session.query(cls).filter_by(first_name=first_name).all()
+        # the cache holds the column values of the members, not objects of a session -> shared by all sessions,
+        # a hit gives objects of the calling session without a query (merge with load=False)
+        # not cached while the session has unflushed changes (the query would flush them first) or uncommitted
+        # written changes (the other sessions must not see them)
+        if (session.new or session.dirty or session.deleted or session.info.get("member_cache_tags")
+                or session.info.get("member_cache_clear")):
+            return session.query(cls).filter_by(first_name=first_name).all()
+        loaded = []
+        def load():
+            loaded.extend(session.query(cls).filter_by(first_name=first_name).all())
+            return [{column.key: getattr(member, column.key) for column in cls.__mapper__.column_attrs}
+                    for member in loaded]
+        rows = get_member_cache(session.get_bind(cls)).get_or_load(("find_by_firstname", first_name),
+                                                                   [("first_name", first_name)], load)
+        if loaded:
+            return loaded
+        members = []
+        for row in rows:
+            member = cls(**row)
+            make_transient_to_detached(member)
+            members.append(session.merge(member, load=False))
+        return members
 
 class Address(Base):
     __tablename__ = 'address'
@@ -62,45 +107,126 @@ DBSession = sessionmaker(bind=engine)
 # session.rollback()
 session = DBSession()
  
+# Invalidate the cached results for the first names (old and new) of the members a session inserts, changes or
+# deletes: at the write (for the later queries of the same session), at the commit (the other sessions may have
+# cached results in the meantime) and at a rollback (the results of the session may contain the rolled back rows)
+# The writes are the flushes of the objects and the statements executed by the session (session.execute(...), also
+# by an AsyncSession). INSERT statements invalidate the first names of their rows, UPDATE and DELETE statements
+# (update(Member).where(...)) clear the cache, their rows are not known.
+# Statements executed on a connection without session are not seen.
+def _collect_member_tags(session, tags=(), clear=False):
+    cache = get_member_cache(session.get_bind(Member))
+    if clear:
+        cache.clear()
+        session.info["member_cache_clear"] = True
+    cache.invalidate(*tags)
+    session.info.setdefault("member_cache_tags", set()).update(tags)
+
+@event.listens_for(Session, "after_flush")
+def _collect_member_changes(session, flush_context):
+    tags = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Member):
+            added, unchanged, deleted = attributes.get_history(obj, "first_name")
+            tags.update(("first_name", name) for name in chain(added, unchanged, deleted))
+    _collect_member_tags(session, tags)
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_member_statements(orm_execute_state):
+    statement = orm_execute_state.statement
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    # the table of update(Member) is an annotated copy of Member.__table__
+    if getattr(getattr(statement, "table", None), "name", None) != Member.__tablename__:
+        return
+    parameters = orm_execute_state.parameters
+    rows = parameters if isinstance(parameters, (list, tuple)) else [parameters or {}]
+    if orm_execute_state.is_insert and rows and all("first_name" in row for row in rows):
+        _collect_member_tags(orm_execute_state.session, {("first_name", row["first_name"]) for row in rows})
+    else:
+        _collect_member_tags(orm_execute_state.session, clear=True)
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _invalidate_member_cache(session):
+    tags = session.info.pop("member_cache_tags", ())
+    clear = session.info.pop("member_cache_clear", False)
+    if tags or clear:
+        cache = get_member_cache(session.get_bind(Member))
+        if clear:
+            cache.clear()
+        cache.invalidate(*tags)
+
+
 # Insert a Member in the member table
 def add_member(m):
     session.add(m)
     session.commit()
 
-memb1 = Member(first_name='Mack', last_name='Dean', fidelity_credit=10)
-add_member(memb1)
- 
 # Insert an Address in the address table
 def add_adress(addr):
     session.add(addr)
     session.commit()
 
-addr1 = Address(post_code='12345', member=memb1)
-add_adress(addr1)
 
-""" Make queries in the members table """
-# Make a query to find all Members in the database
-session.query(Member).all()
-# Return the first Member from all Members in the database
-member = session.query(Member).first()
-print(member.first_name)
+# Insert many rows (dicts of column values, e.g. {'first_name': 'Mack', 'last_name': 'Dean'}) from an iterable
+# batch by batch: one Core INSERT executed for all rows of a batch and one commit per batch, no ORM objects
+# -> returns the number of rows
+def bulk_insert(session, model, rows, batch_size=10000):
+    rows = iter(rows)
+    n_rows = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return n_rows
+        # the cached results of the members are invalidated by the do_orm_execute event
+        session.execute(insert(model.__table__), batch)
+        session.commit()
+        n_rows += len(batch)
+
+def add_members_bulk(session, members, batch_size=10000):
+    return bulk_insert(session, Member, members, batch_size)
+
+def add_addresses_bulk(session, addresses, batch_size=10000):
+    return bulk_insert(session, Address, addresses, batch_size)
+
+
+# Load the addresses together with their members -> Address.__repr__ and address.member do not query the
+# member of each address one at a time (N + 1 queries)
+# selectin: a second query for the members of all addresses (WHERE member.id IN (...)),
+# joined: one query with a LEFT OUTER JOIN, None: lazy loading of each member
+EAGER_LOADERS = {"selectin": selectinload, "joined": joinedload}
 
-# Find all Members whose member first_name field is 'Mack'
-Member.find_by_firstname(session, 'Mack')
-# this is the same as using the following:
-session.query(Member).filter(Member.first_name=='Mack').first()
-# find all Members with first_names similar to 'Mack'
-session.query(Member).filter(Member.first_name.like('%Mack%')).first()
+def _load_members(query, eager):
+    return query.options(EAGER_LOADERS[eager](Address.member)) if eager is not None else query
 
+def get_addresses(session, eager="selectin", **filters):
+    return _load_members(session.query(Address), eager).filter_by(**filters).all()
 
-""" Make queries in the address table """
-# Find all Address whose member field is pointing to the member object
-session.query(Address).filter(Address.member == member).all()
+def get_addresses_of_members(session, member_ids, eager="selectin"):
+    return _load_members(session.query(Address), eager).filter(Address.member_id.in_(member_ids)).all()
 
-# Retrieve one Address whose member field is point to the member object
-session.query(Address).filter(Address.member == member).one()
-address = session.query(Address).filter(Address.member == member).one()
-print(address.post_code)
+
+# Count the SQL statements sent to the database, e.g.
+#     with QueryCounter(engine) as counter:
+#         print(get_addresses(session))
+#     assert counter.count == 2
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.statements = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
 
 
 """ Create a new table after the initial create_all """
@@ -116,3 +242,45 @@ class Contract(Base):
 # create a new table
 Contract.__table__.create(engine)
 
+
+if __name__ == "__main__":
+    memb1 = Member(first_name='Mack', last_name='Dean', fidelity_credit=10)
+    add_member(memb1)
+ 
+    addr1 = Address(post_code='12345', member=memb1)
+    add_adress(addr1)
+
+    """ Make queries in the members table """
+    # Make a query to find all Members in the database
+    session.query(Member).all()
+    # Return the first Member from all Members in the database
+    member = session.query(Member).first()
+    print(member.first_name)
+
+    # Find all Members whose member first_name field is 'Mack'
+    Member.find_by_firstname(session, 'Mack')
+    # this is the same as using the following:
+    session.query(Member).filter(Member.first_name=='Mack').first()
+    # find all Members with first_names similar to 'Mack'
+    session.query(Member).filter(Member.first_name.like('%Mack%')).first()
+
+
+    """ Make queries in the address table """
+    # Find all Address whose member field is pointing to the member object
+    session.query(Address).filter(Address.member == member).all()
+
+    # Retrieve one Address whose member field is point to the member object
+    session.query(Address).filter(Address.member == member).one()
+    address = session.query(Address).filter(Address.member == member).one()
+    print(address.post_code)
+
+    """ Cached queries: a new session (e.g. of the next request) gets the cached members without a query """
+    Member.find_by_firstname(session, 'Mack')
+    with DBSession() as new_session, QueryCounter(engine) as counter:
+        print(Member.find_by_firstname(new_session, 'Mack'), counter.count, "queries")
+    print(get_member_cache(engine).info())
+
+    """ Load addresses with their members without one query per address """
+    with QueryCounter(engine) as counter:
+        print(get_addresses(session, eager="selectin"))
+    print(counter.count, "queries")
@@ -1,4 +1,8 @@
 import sqlite3
+from contextlib import contextmanager
+from itertools import islice
+
+from query_cache import QueryCache
 
 # define a class whose instances you want to store with sql
 class Member(object):
@@ -19,94 +23,217 @@ class Member(object):
         return "Member('{}', '{}')".format(self.first_name, self.last_name)
 
 
+# pragma profiles for the connections, "ingest": for loading many rows, "concurrent": several connections
+# WAL journal (readers do not block the writer), no fsync at every commit (only at checkpoints), 64 MB page cache,
+# wait up to 5 s for a lock instead of failing
+PRAGMA_PROFILES = {
+    "default": {},
+    "ingest": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -64000, "temp_store": "MEMORY"},
+    "concurrent": {"journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 5000},
+}
+
+
+def apply_pragmas(connection, profile="default"):
+    pragmas = PRAGMA_PROFILES[profile] if isinstance(profile, str) else profile
+    for name, value in pragmas.items():
+        connection.execute(f"PRAGMA {name} = {value}")
+
+
+@contextmanager
+def temporary_pragmas(connection, profile):
+    # the pragmas of the profile inside the with block, the previous values afterwards
+    # (journal_mode is stored in the database file, the others would stay set for the connection)
+    pragmas = PRAGMA_PROFILES[profile] if isinstance(profile, str) else profile
+    previous = {name: connection.execute(f"PRAGMA {name}").fetchone()[0] for name in pragmas}
+    apply_pragmas(connection, pragmas)
+    try:
+        yield connection
+    finally:
+        apply_pragmas(connection, previous)
+
+
+# index name -> columns, all lookups filter on last_name or on last_name and first_name
+# -> one composite index (last_name first) serves both
+INDEXES = {
+    "members_last_first_name": ("last_name", "first_name"),
+}
+
+
+def create_indexes(connection):
+    with connection:
+        for name, columns in INDEXES.items():
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON members({', '.join(columns)})")
+
+
+def drop_indexes(connection):
+    # e.g. before loading many rows, creating the index afterwards is faster than updating it with every row
+    with connection:
+        for name in INDEXES:
+            connection.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def create_table(connection, indexes=True):
+    with connection:
+        connection.execute("""CREATE TABLE IF NOT EXISTS members(
+                           first_name TEXT,
+                           last_name TEXT,
+                           fidelity_credit INTEGER
+                           )""")
+    if indexes:
+        create_indexes(connection)
+
+
+def open_database(filename=":memory:", profile="default", indexes=True):
+    connection = sqlite3.connect(filename)
+    apply_pragmas(connection, profile)
+    create_table(connection, indexes)
+    return connection
+
+
 # create a database connection
-# connection = sqlite3.connect("members.db")  # store the database in a file
+# connection = open_database("members.db")  # store the database in a file
 
-connection = sqlite3.connect(":memory:")  # hold the database on RAM only 
+connection = open_database(":memory:")  # hold the database on RAM only
 # -> will be erased after stopping the program 
 # -> good for simple testing
 
 # create a cursor to work on the database
 c = connection.cursor()
 
-# create a table in the database
-with connection:
-    c.execute("""CREATE TABLE IF NOT EXISTS members(
-                first_name TEXT,
-                last_name TEXT,
-                fidelity_credit INTEGER
-                )""")
+# results of the read functions, the write functions invalidate the last names of the members they change
+member_cache = QueryCache(maxsize=1024)
 
 # function to add elements to the table
 def insert_member(m):
     with connection:  # usage of context manager -> no need to commit manually the execution
         c.execute("INSERT INTO members VALUES (:first_name, :last_name, :fidelity_credit)", 
         {'first_name': m.first_name, 'last_name': m.last_name, 'fidelity_credit': m.fidelity_credit})
+    member_cache.invalidate(("last_name", m.last_name))
 
 # insert a list of elements to the table
 def insert_several_members(m: (list,tuple)):
     m = [{'first_name': e.first_name, 'last_name': e.last_name, 'fidelity_credit': e.fidelity_credit} for e in m]
     with connection:
         c.executemany("""INSERT INTO members VALUES(:first_name, :last_name, :fidelity_credit)""", m)
+    member_cache.invalidate(*{("last_name", e['last_name']) for e in m})
+
+
+# insert many members: the members (or (first_name, last_name, fidelity_credit) tuples) are read from the iterable
+# batch by batch -> any number of members with constant memory, one transaction per batch
+# executemany prepares the statement once and binds the tuples of the batch one after the other
+# db: connection to use instead of the module connection, profile: pragmas during the insertion only
+def insert_members_bulk(members, batch_size=10000, db=None, profile=None):
+    db = db if db is not None else connection
+    rows = ((m.first_name, m.last_name, m.fidelity_credit) if isinstance(m, Member) else tuple(m) for m in members)
+    n_rows = 0
+    with temporary_pragmas(db, profile if profile is not None else {}):
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return n_rows
+            with db:
+                db.executemany("INSERT INTO members VALUES (?, ?, ?)", batch)
+            member_cache.invalidate(*{("last_name", row[1]) for row in batch})
+            n_rows += len(batch)
+
+
+# the statements of the query functions, checked by check_query_plans
+SELECT_BY_LASTNAME = "SELECT * FROM members WHERE last_name=:last_name"
+UPDATE_FIDELITY_CREDIT = """UPDATE members SET fidelity_credit = :fidelity_credit
+                         WHERE first_name = :first_name AND last_name = :last_name"""
+DELETE_MEMBER = "DELETE from members WHERE first_name = :first_name AND last_name = :last_name"
 
 
 # function to read from the table
     # read only one element for the given argument
 def get_single_member_by_lastname(last_name):
-    c.execute("SELECT * FROM members WHERE last_name=:last_name", {'last_name': last_name})
-    return c.fetchone()
+    return member_cache.get_or_load(("get_single_member_by_lastname", last_name), [("last_name", last_name)],
+                                    lambda: c.execute(SELECT_BY_LASTNAME, {'last_name': last_name}).fetchone())
 
     # read all elements for the given argument
 def get_members_by_lastname(last_name):
-    c.execute("SELECT * FROM members WHERE last_name=:last_name", {'last_name': last_name})
-    return c.fetchall()
+    return member_cache.get_or_load(("get_members_by_lastname", last_name), [("last_name", last_name)],
+                                    lambda: c.execute(SELECT_BY_LASTNAME, {'last_name': last_name}).fetchall())
 
 
 # function to update a field for certain table entries: fidelity credit in this case
 def update_fidelity_credit(m, fidelity_credit):
     with connection:
-        c.execute("""UPDATE members SET fidelity_credit = :fidelity_credit
-                  WHERE first_name = :first_name AND last_name = :last_name""",
+        c.execute(UPDATE_FIDELITY_CREDIT,
                   {'first_name': m.first_name, 'last_name': m.last_name, 'fidelity_credit': fidelity_credit})
+    member_cache.invalidate(("last_name", m.last_name))
 
 
 # function to erase lines from the table
 def remove_member(m):
     with connection:
-        c.execute("DELETE from members WHERE first_name = :first_name AND last_name = :last_name",
-                  {'first_name': m.first_name, 'last_name': m.last_name})
+        c.execute(DELETE_MEMBER, {'first_name': m.first_name, 'last_name': m.last_name})
+    member_cache.invalidate(("last_name", m.last_name))
+
+
+# query function -> (statement, example parameters)
+QUERIES = {
+    "get_single_member_by_lastname": (SELECT_BY_LASTNAME, {'last_name': ''}),
+    "get_members_by_lastname": (SELECT_BY_LASTNAME, {'last_name': ''}),
+    "update_fidelity_credit": (UPDATE_FIDELITY_CREDIT, {'first_name': '', 'last_name': '', 'fidelity_credit': 0}),
+    "remove_member": (DELETE_MEMBER, {'first_name': '', 'last_name': ''}),
+}
+
+
+def explain_query_plan(sql, parameters=None, db=None):
+    # -> the steps of the query plan, e.g. ["SEARCH members USING INDEX members_last_first_name (last_name=?)"]
+    db = db if db is not None else connection
+    return [row[3] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}", parameters or {})]
+
+
+def check_query_plans(db=None):
+    # -> {query function: query plan}, ValueError if a query function scans the whole table
+    plans = {name: explain_query_plan(sql, parameters, db) for name, (sql, parameters) in QUERIES.items()}
+    scans = {name: plan for name, plan in plans.items()
+             if any(step.startswith("SCAN") and "USING" not in step for step in plan)}
+    if scans:
+        raise ValueError(f"full table scans: {scans}")
+    return plans
 
 
 # erase a table
 def erase_table(table_name):
     with connection:
         c.execute(f"DROP TABLE IF EXISTS {table_name}")
+    member_cache.clear()
+
 
+if __name__ == "__main__":
+    print(check_query_plans())
 
-memb1 = Member('Max', 'Martin', 45)
-memb2 = Member('Anne', 'Martin', 200)
-memb3 = Member('Leo', 'Joe', 39)
-memb4 = Member('Marie', 'Joe', 11)
+    memb1 = Member('Max', 'Martin', 45)
+    memb2 = Member('Anne', 'Martin', 200)
+    memb3 = Member('Leo', 'Joe', 39)
+    memb4 = Member('Marie', 'Joe', 11)
 
 
-insert_member(memb1)
-insert_member(memb2)
+    insert_member(memb1)
+    insert_member(memb2)
 
-membs = get_members_by_lastname('Martin')
-print(membs)
+    membs = get_members_by_lastname('Martin')
+    print(membs)
 
-memb = get_single_member_by_lastname('Martin')
-print(memb)
+    memb = get_single_member_by_lastname('Martin')
+    print(memb)
 
-insert_several_members([memb3, memb4])
-membs = get_members_by_lastname('Joe')
-print(membs)
+    insert_several_members([memb3, memb4])
+    membs = get_members_by_lastname('Joe')
+    print(membs)
 
-update_fidelity_credit(memb2, 230)
-remove_member(memb1)
-membs = get_members_by_lastname('Martin')
-print(membs)
+    update_fidelity_credit(memb2, 230)
+    remove_member(memb1)
+    membs = get_members_by_lastname('Martin')
+    print(membs)
+    # the cached results of 'Martin' were invalidated by the writes
+    assert membs == [('Anne', 'Martin', 230)]
+    assert get_members_by_lastname('Martin') == membs
+    print(member_cache.info())
 
-erase_table('members')
+    erase_table('members')
 
-connection.close()
\ No newline at end of file
+    connection.close()
@@ -0,0 +1,219 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from sqlite3_db import (DELETE_MEMBER, SELECT_BY_LASTNAME, UPDATE_FIDELITY_CREDIT, apply_pragmas, create_table)
+
+"""
+Thread safe access to the members table of sqlite3_db, e.g. from the threads of a web server:
+    store = MemberStore("members.db", pool_size=8)
+    store.insert_member(member)
+    store.get_members_by_lastname("Martin")
+- reads: a bounded pool of connections, a thread takes a connection for one query and gives it back
+  (the threads wait if all pool_size connections are in use)
+- writes: SQLite allows one writer at a time -> all writes go through a queue to one writer thread with its own
+  connection. It commits the writes waiting in the queue in one transaction (group commit), each write in its own
+  savepoint so that a failing write does not undo the others. The write methods wait for the commit,
+  submit_write returns a Future.
+- WAL mode: the readers see the last commit and are not blocked by the writer.
+- cache: optional query_cache.QueryCache for the reads, the writer invalidates the last names of the changed
+  members after the commit, before the write methods return
+"""
+
+
+class MemberStore:
+    def __init__(self, filename, pool_size=8, profile="concurrent", max_batch=256, timeout=30.0, cache=None):
+        if filename == ":memory:" or not filename:
+            raise ValueError("the connections of the pool need a database file")
+        self.filename = filename
+        self.pool_size = pool_size
+        self.profile = profile
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.cache = cache
+
+        self._pool = queue.LifoQueue()  # the last used connection first, its cache is warm
+        self._n_connections = 0
+        self._pool_lock = threading.Lock()
+        self._writes = queue.Queue()
+        self._closed = False
+        self._closed_lock = threading.Lock()  # no write is queued after the stop of the writer
+        self._writer_connection = self._connect()
+        create_table(self._writer_connection)
+        # autocommit mode, the transactions are managed by the writer
+        self._writer_connection.isolation_level = None
+        self._writer = threading.Thread(target=self._write_loop, name="MemberStore writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.filename, timeout=self.timeout, check_same_thread=False)
+        apply_pragmas(connection, self.profile)
+        return connection
+
+    @contextmanager
+    def reader(self):
+        # -> connection of the pool for reading, given back at the end of the with block
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                create = self._n_connections < self.pool_size
+                self._n_connections += create
+            try:
+                connection = self._connect() if create else self._pool.get(timeout=self.timeout)
+            except BaseException:
+                if create:
+                    with self._pool_lock:
+                        self._n_connections -= 1  # the connection of a later reader may succeed
+                raise
+        try:
+            yield connection
+        finally:
+            self._pool.put(connection)
+
+    def _write_loop(self):
+        connection = self._writer_connection
+        while True:
+            writes = [self._writes.get()]
+            # the writes which arrived in the meantime go into the same transaction
+            while len(writes) < self.max_batch:
+                try:
+                    writes.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in writes
+            writes = [write for write in writes if write is not None]
+
+            results = []
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                for function, future, _ in writes:
+                    connection.execute("SAVEPOINT write")
+                    try:
+                        results.append((future, function(connection), None))
+                        connection.execute("RELEASE write")
+                    except Exception as e:
+                        connection.execute("ROLLBACK TO write")
+                        connection.execute("RELEASE write")
+                        results.append((future, None, e))
+                connection.execute("COMMIT")
+            except Exception as e:
+                # the transaction failed (e.g. disk full) -> all its writes failed
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                results = [(future, None, e) for _, future, _ in writes]
+            else:
+                if self.cache is not None:
+                    self.cache.invalidate(*{tag for _, _, tags in writes for tag in tags})
+
+            # the futures are completed after the commit -> a reader started afterwards sees the writes
+            for future, result, exception in results:
+                if exception is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(exception)
+            if stop:
+                return
+
+    def submit_write(self, function, tags=()):
+        # function(connection) is executed by the writer thread -> Future of its result
+        # tags: invalidated in the cache after the commit
+        future = Future()
+        with self._closed_lock:
+            if self._closed:
+                raise ValueError("the MemberStore is closed")
+            self._writes.put((function, future, tags))
+        return future
+
+    def write(self, function, tags=()):
+        return self.submit_write(function, tags).result()
+
+    def insert_member(self, m):
+        self.write(lambda connection: connection.execute(
+            "INSERT INTO members VALUES (?, ?, ?)", (m.first_name, m.last_name, m.fidelity_credit)),
+            [("last_name", m.last_name)])
+
+    def insert_several_members(self, m):
+        rows = [(e.first_name, e.last_name, e.fidelity_credit) for e in m]
+        self.write(lambda connection: connection.executemany("INSERT INTO members VALUES (?, ?, ?)", rows),
+                   {("last_name", row[1]) for row in rows})
+
+    def update_fidelity_credit(self, m, fidelity_credit):
+        self.write(lambda connection: connection.execute(UPDATE_FIDELITY_CREDIT, {
+            'first_name': m.first_name, 'last_name': m.last_name, 'fidelity_credit': fidelity_credit}),
+            [("last_name", m.last_name)])
+
+    def remove_member(self, m):
+        self.write(lambda connection: connection.execute(
+            DELETE_MEMBER, {'first_name': m.first_name, 'last_name': m.last_name}), [("last_name", m.last_name)])
+
+    def _read(self, key, last_name, fetch):
+        def load():
+            with self.reader() as connection:
+                return fetch(connection.execute(SELECT_BY_LASTNAME, {'last_name': last_name}))
+        if self.cache is None:
+            return load()
+        return self.cache.get_or_load((key, last_name), [("last_name", last_name)], load)
+
+    def get_single_member_by_lastname(self, last_name):
+        return self._read("get_single_member_by_lastname", last_name, lambda cursor: cursor.fetchone())
+
+    def get_members_by_lastname(self, last_name):
+        return self._read("get_members_by_lastname", last_name, lambda cursor: cursor.fetchall())
+
+    def close(self):
+        # the writes in the queue are still committed
+        with self._closed_lock:
+            stop = not self._closed
+            self._closed = True
+            if stop:
+                self._writes.put(None)
+        self._writer.join()
+        self._writer_connection.close()
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    import os
+    import random
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    from query_cache import QueryCache
+    from sqlite3_db import Member
+
+    with tempfile.TemporaryDirectory() as folder, \
+            MemberStore(os.path.join(folder, "members.db"), cache=QueryCache(maxsize=100)) as store:
+        members = [Member(f"first_{i}", f"last_{i % 10}", i) for i in range(1000)]
+        with ThreadPoolExecutor(16) as executor:
+            list(executor.map(store.insert_member, members))
+            print(len(store.get_members_by_lastname("last_3")))
+            list(executor.map(lambda m: store.update_fidelity_credit(m, 0), members[:500]))
+        print(store.get_single_member_by_lastname("last_3"))
+
+        # every thread updates its own members and reads them back through the cache while the other threads
+        # read and write the same last names -> a read after a write must never return an older value
+        def update_and_read(thread):
+            for i in range(200):
+                m = members[thread + 16 * random.randrange(len(members) // 16)]
+                credit = random.randrange(10 ** 6)
+                store.update_fidelity_credit(m, credit)
+                rows = store.get_members_by_lastname(m.last_name)
+                assert (m.first_name, m.last_name, credit) in rows, "stale read"
+                store.get_members_by_lastname(f"last_{random.randrange(10)}")
+
+        with ThreadPoolExecutor(16) as executor:
+            list(executor.map(update_and_read, range(16)))
+        print(store.cache.info())
@@ -0,0 +1,101 @@
+import asyncio
+
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+from sql_alchemy_async import MemberRepository
+from sql_alchemy_db import Base, Member, add_members_bulk, get_member_cache
+
+
+def new_sessions(url):
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine)
+
+
+def names(sessions, first_name):
+    # a new session for each lookup, like a new request
+    with sessions() as session:
+        return sorted((m.last_name, m.fidelity_credit) for m in Member.find_by_firstname(session, first_name))
+
+
+def test_sync_update_and_delete(tmp_path):
+    engine, sessions = new_sessions(f"sqlite:///{tmp_path / 'members.db'}")
+    with sessions() as session:
+        session.add_all([Member(first_name='Mack', last_name='Dean', fidelity_credit=1),
+                         Member(first_name='Mack', last_name='Smith', fidelity_credit=2)])
+        session.commit()
+    assert names(sessions, 'Mack') == [('Dean', 1), ('Smith', 2)]
+    assert names(sessions, 'Mack') == [('Dean', 1), ('Smith', 2)]  # from the cache
+
+    # ORM update of a column and of the first name
+    with sessions() as session:
+        dean, smith = sorted(session.query(Member).all(), key=lambda m: m.last_name)
+        dean.fidelity_credit = 10
+        smith.first_name = 'Max'
+        session.commit()
+    assert names(sessions, 'Mack') == [('Dean', 10)]
+    assert names(sessions, 'Max') == [('Smith', 2)]
+
+    # Core update, bulk insert and ORM delete
+    with sessions() as session:
+        session.execute(update(Member).where(Member.last_name == 'Dean').values(fidelity_credit=20))
+        session.commit()
+    assert names(sessions, 'Mack') == [('Dean', 20)]
+    with sessions() as session:
+        add_members_bulk(session, [{'first_name': 'Max', 'last_name': 'Miller', 'fidelity_credit': 3}])
+    assert names(sessions, 'Max') == [('Miller', 3), ('Smith', 2)]
+    with sessions() as session:
+        session.delete(session.query(Member).filter_by(last_name='Smith').one())
+        session.commit()
+    assert names(sessions, 'Max') == [('Miller', 3)]
+    engine.dispose()
+
+
+def test_async_update_and_delete(tmp_path):
+    filename = tmp_path / 'members.db'
+    engine, sessions = new_sessions(f"sqlite:///{filename}")
+
+    async def run():
+        repository = await MemberRepository.open(f"sqlite+aiosqlite:///{filename}")
+        member = await repository.add_member(first_name='Mack', last_name='Dean', fidelity_credit=1)
+        assert names(sessions, 'Mack') == [('Dean', 1)]
+        await repository.update_fidelity_credit(member.id, 5)
+        assert names(sessions, 'Mack') == [('Dean', 5)]
+        await repository.add_members([{'first_name': 'Mack', 'last_name': 'Doe', 'fidelity_credit': 0}])
+        assert names(sessions, 'Mack') == [('Dean', 5), ('Doe', 0)]
+        await repository.remove_member(member.id)
+        assert names(sessions, 'Mack') == [('Doe', 0)]
+        await repository.close()
+
+    asyncio.run(run())
+    engine.dispose()
+
+
+def test_rollback_is_not_cached(tmp_path):
+    engine, sessions = new_sessions(f"sqlite:///{tmp_path / 'members.db'}")
+    with sessions() as session:
+        session.execute(update(Member).values(fidelity_credit=0))
+        session.add(Member(first_name='Mack', last_name='Dean', fidelity_credit=1))
+        session.flush()
+        # the uncommitted member is seen by its session, but not stored for the other sessions
+        assert len(Member.find_by_firstname(session, 'Mack')) == 1
+        session.rollback()
+    assert names(sessions, 'Mack') == []
+    engine.dispose()
+
+
+def test_one_cache_per_database(tmp_path):
+    engines = [new_sessions("sqlite:///:memory:"), new_sessions(f"sqlite:///{tmp_path / 'members.db'}")]
+    for i, (_, sessions) in enumerate(engines):
+        with sessions() as session:
+            session.add(Member(first_name='Mack', last_name=f"Dean_{i}", fidelity_credit=i))
+            session.commit()
+    assert [names(sessions, 'Mack') for _, sessions in engines] == [[('Dean_0', 0)], [('Dean_1', 1)]]
+    assert get_member_cache(engines[0][0]) is not get_member_cache(engines[1][0])
+    # the same database file -> the same cache
+    other_engine = create_engine(f"sqlite:///{tmp_path / 'members.db'}")
+    assert get_member_cache(other_engine) is get_member_cache(engines[1][0])
+    for engine, _ in engines:
+        engine.dispose()
+    other_engine.dispose()
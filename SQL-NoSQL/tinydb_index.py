@@ -0,0 +1,336 @@
+import bisect
+import time
+
+from tinydb.middlewares import Middleware
+
+"""
+Secondary indexes for a TinyDB table (or database), the queries of tinydb_db without scanning every document:
+    table = IndexedTable(db, hash_fields=["first_name"], sorted_fields=["id"])
+    table.insert({'id': 1, 'first_name': 'Tim', 'last_name': 'Hu'})
+    table.search(User.first_name == 'Tim')  # hash index
+    table.search(User.id > 0)  # sorted index
+- hash index: ==, one_of
+- sorted index: ==, <, <=, >, >=
+- & and | of such queries on indexed fields, the other parts of an & are checked on the documents found by the
+  indexed part, everything else (e.g. nested fields, ~, test) scans the table like TinyDB
+The indexes are updated by insert, insert_multiple, update, remove and purge/truncate of the IndexedTable,
+writes which bypass it (e.g. db.insert) need a reindex().
+
+WriteBatchingMiddleware keeps the data of a file storage in memory and writes it after write_batch writes or
+flush_interval seconds (checked at the next write), at flush() and at close():
+    db = TinyDB("db.json", storage=WriteBatchingMiddleware(JSONStorage, write_batch=1000))
+"""
+
+_COMPARISONS = {"==", "<", "<=", ">", ">="}
+
+
+def _query_hash(cond):
+    # the structure of a query, e.g. ('==', ('first_name',), 'Tim'), ('and', frozenset({...}))
+    # (_hash from TinyDB 4 on, hashval before)
+    return getattr(cond, "_hash", getattr(cond, "hashval", None))
+
+
+class HashIndex:
+    def __init__(self, field):
+        self.field = field
+        self._ids = {}  # value -> ids of the documents with this value
+        # ids of the documents with an unhashable value (e.g. a list, equal to the tuple of a query) -> always
+        # candidates, the query decides
+        self._unhashable = set()
+
+    def add(self, doc_id, document):
+        try:
+            self._ids.setdefault(document[self.field], set()).add(doc_id)
+        except KeyError:
+            pass  # documents without the field are never equal to a query value
+        except TypeError:
+            self._unhashable.add(doc_id)
+
+    def discard(self, doc_id, document):
+        self._unhashable.discard(doc_id)
+        try:
+            ids = self._ids[document[self.field]]
+        except (KeyError, TypeError):
+            return
+        ids.discard(doc_id)
+        if not ids:
+            del self._ids[document[self.field]]
+
+    def lookup(self, operation, value):
+        # -> ids of the documents matching the operation, None if the index can not answer it
+        try:
+            if operation == "==":
+                return self._unhashable.union(self._ids.get(value, ()))
+            if operation == "one_of":
+                return self._unhashable.union(*(self._ids.get(v, ()) for v in value))
+        except TypeError:
+            return None  # unhashable query value
+        return None
+
+    def clear(self):
+        self._ids.clear()
+        self._unhashable.clear()
+
+
+class SortedIndex:
+    def __init__(self, field):
+        self.field = field
+        self._entries = []  # (value, doc id) in sorted order
+        # False if the values can not be ordered (e.g. numbers and strings) -> the queries scan the table
+        self.valid = True
+
+    def add(self, doc_id, document):
+        if self.field not in document or not self.valid:
+            return
+        try:
+            bisect.insort(self._entries, (document[self.field], doc_id))
+        except TypeError:
+            self.valid = False
+
+    def add_many(self, documents):
+        # (doc id, document) pairs, one sort instead of an insertion for each document
+        self._entries.extend((document[self.field], doc_id) for doc_id, document in documents
+                             if self.field in document)
+        try:
+            self._entries.sort()
+        except TypeError:
+            self.valid = False
+
+    def discard(self, doc_id, document):
+        if self.field not in document or not self.valid:
+            return
+        entry = (document[self.field], doc_id)
+        i = bisect.bisect_left(self._entries, entry)
+        if i < len(self._entries) and self._entries[i] == entry:
+            del self._entries[i]
+
+    def lookup(self, operation, value):
+        if not self.valid or operation not in _COMPARISONS:
+            return None
+        # the doc ids are ints -> (value, -inf) comes before and (value, inf) after all entries with value
+        try:
+            start = bisect.bisect_left(self._entries, (value, -float("inf")))
+            end = bisect.bisect_right(self._entries, (value, float("inf")))
+        except TypeError:
+            return None
+        ranges = {"==": (start, end), "<": (0, start), "<=": (0, end), ">": (end, None), ">=": (start, None)}
+        first, last = ranges[operation]
+        return {doc_id for _, doc_id in self._entries[first:last]}
+
+    def clear(self):
+        self._entries.clear()
+        self.valid = True
+
+
+class IndexedTable:
+    def __init__(self, table, hash_fields=(), sorted_fields=()):
+        self.table = table
+        self.hash_indexes = {field: HashIndex(field) for field in hash_fields}
+        self.sorted_indexes = {field: SortedIndex(field) for field in sorted_fields}
+        self.reindex()
+
+    def _indexes(self):
+        return list(self.hash_indexes.values()) + list(self.sorted_indexes.values())
+
+    def reindex(self):
+        documents = [(document.doc_id, document) for document in self.table.all()]
+        for index in self.hash_indexes.values():
+            index.clear()
+            for doc_id, document in documents:
+                index.add(doc_id, document)
+        for index in self.sorted_indexes.values():
+            index.clear()
+            index.add_many(documents)
+
+    def _add(self, doc_id, document):
+        for index in self._indexes():
+            index.add(doc_id, document)
+
+    def _discard(self, doc_id, document):
+        for index in self._indexes():
+            index.discard(doc_id, document)
+
+    def _lookup(self, query):
+        # -> ids of the documents which may match the query, None if the indexes can not answer it
+        if not isinstance(query, tuple) or not query:
+            return None
+        operation = query[0]
+        if operation == "and":
+            # the smallest set of the indexed parts, the other parts are checked on its documents
+            candidates = [ids for ids in map(self._lookup, query[1]) if ids is not None]
+            return min(candidates, key=len) if candidates else None
+        if operation == "or":
+            candidates = [self._lookup(part) for part in query[1]]
+            return set().union(*candidates) if all(ids is not None for ids in candidates) else None
+        if len(query) != 3 or not isinstance(query[1], tuple) or len(query[1]) != 1:
+            return None
+        field, value = query[1][0], query[2]
+        for index in [self.hash_indexes.get(field), self.sorted_indexes.get(field)]:
+            ids = index.lookup(operation, value) if index is not None else None
+            if ids is not None:
+                return ids
+        return None
+
+    def _get(self, doc_ids):
+        if not doc_ids:
+            return []
+        doc_ids = sorted(doc_ids)
+        try:
+            # one read of the table and a dict lookup per id, get(doc_ids=...) iterates over all documents
+            raw_table = self.table._read_table()
+            document_class, document_id_class = self.table.document_class, self.table.document_id_class
+        except AttributeError:
+            # before TinyDB 4
+            documents = (self.table.get(doc_id=doc_id) for doc_id in doc_ids)
+            return [document for document in documents if document is not None]
+        return [document_class(raw_table[str(doc_id)], document_id_class(doc_id)) for doc_id in doc_ids
+                if str(doc_id) in raw_table]
+
+    def search(self, cond):
+        doc_ids = self._lookup(_query_hash(cond))
+        if doc_ids is None:
+            return self.table.search(cond)
+        # the condition still decides, e.g. for the parts of an & without index
+        return [document for document in self._get(doc_ids) if cond(document)]
+
+    def get(self, cond=None, doc_id=None):
+        if doc_id is not None:
+            return self.table.get(doc_id=doc_id)
+        documents = self.search(cond)
+        return documents[0] if documents else None
+
+    def contains(self, cond):
+        return bool(self.search(cond))
+
+    def count(self, cond):
+        return len(self.search(cond))
+
+    def all(self):
+        return self.table.all()
+
+    def __len__(self):
+        return len(self.table)
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def insert(self, document):
+        doc_id = self.table.insert(document)
+        self._add(doc_id, document)
+        return doc_id
+
+    def insert_multiple(self, documents):
+        documents = list(documents)
+        doc_ids = self.table.insert_multiple(documents)
+        for doc_id, document in zip(doc_ids, documents):
+            self._add(doc_id, document)
+        return doc_ids
+
+    def _matching(self, cond, doc_ids):
+        if doc_ids is not None:
+            return self._get(set(doc_ids))
+        if cond is None:
+            return self.table.all()
+        return self.search(cond)
+
+    def update(self, fields, cond=None, doc_ids=None):
+        # fields: dict of new values or function(document) changing the document, as for TinyDB
+        documents = self._matching(cond, doc_ids)
+        doc_ids = [document.doc_id for document in documents]
+        for document in documents:
+            self._discard(document.doc_id, document)
+        self.table.update(fields, doc_ids=doc_ids)
+        for document in self._get(doc_ids):
+            self._add(document.doc_id, document)
+        return doc_ids
+
+    def remove(self, cond=None, doc_ids=None):
+        documents = self._matching(cond, doc_ids)
+        doc_ids = [document.doc_id for document in documents]
+        self.table.remove(doc_ids=doc_ids)
+        for document in documents:
+            self._discard(document.doc_id, document)
+        return doc_ids
+
+    def truncate(self):
+        if hasattr(self.table, "truncate"):
+            self.table.truncate()
+        else:
+            self.table.purge()  # before TinyDB 4
+        for index in self._indexes():
+            index.clear()
+
+    purge = truncate
+
+
+class WriteBatchingMiddleware(Middleware):
+    def __init__(self, storage_cls, write_batch=1000, flush_interval=1.0):
+        super().__init__(storage_cls)
+        self.write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.cache = None
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def read(self):
+        if self.cache is None:
+            self.cache = self.storage.read()
+        return self.cache
+
+    def write(self, data):
+        self.cache = data
+        self._pending += 1
+        if self._pending >= self.write_batch or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.storage.write(self.cache)
+            self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.storage.close()
+
+
+if __name__ == "__main__":
+    import random
+
+    from tinydb import Query, TinyDB
+    from tinydb.storages import MemoryStorage
+
+    # the queries of tinydb_db
+    db = TinyDB(storage=MemoryStorage)
+    table = IndexedTable(db, hash_fields=["first_name"], sorted_fields=["id"])
+    table.insert({'id': 1, 'first_name': 'Tim', 'last_name': 'Hu'})
+    table.insert({'id': 2, 'first_name': 'Luke', 'last_name': 'Hu'})
+
+    User = Query()
+    print(table.search(User.first_name == 'Tim'))
+    print(table.search(User.id > 0))
+    table.update({'first_name': 'Scott'}, User.id == 1)
+    print(table.search(User.first_name == 'Scott'), table.search(User.first_name == 'Tim'))
+    table.remove(User.id > 1)
+    print(table.all())
+    table.purge()
+    print(table.all(), table.search(User.id > 0))
+
+    # random writes, the indexed searches give the same documents as scanning the table
+    names = ["Tim", "Luke", "Anne", "Marie"]
+    queries = [User.first_name == "Tim", User.id > 500, User.id <= 100, User.first_name.one_of(["Anne", "Luke"]),
+               (User.id >= 300) & (User.first_name == "Marie"), (User.id < 10) | (User.first_name == "Luke"),
+               (User.id > 200) & (User.last_name == "Hu")]
+    table.insert_multiple({'id': i, 'first_name': random.choice(names), 'last_name': 'Hu'} for i in range(1000))
+    for _ in range(200):
+        k = random.randrange(1000)
+        operation = random.choice(["insert", "update", "remove"])
+        if operation == "insert":
+            table.insert({'id': k, 'first_name': random.choice(names), 'last_name': 'Hu'})
+        elif operation == "update":
+            table.update({'first_name': random.choice(names), 'id': random.randrange(1000)}, User.id == k)
+        else:
+            table.remove((User.first_name == random.choice(names)) & (User.id == k))
+        for query in queries:
+            assert sorted(d.doc_id for d in table.search(query)) == sorted(d.doc_id for d in db.search(query))
+    print(len(table), "documents, indexes consistent")
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from stretch_contrast_bw import stretch_contrast
+from stretch_contrast_chunked import stretch_contrast_chunked
+
+
+def timeit(function, repeat=10):
+    # best of repeat runs in ms
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return min(durations) * 1000
+
+
+def benchmark_lut(size=(4096, 4096), window=(1000, 40000)):
+    image = np.random.default_rng(0).integers(0, 2 ** 16, size, dtype=np.uint16)
+    out = np.empty(size, dtype=np.uint8)
+
+    cases = {
+        "float64 result": lambda: stretch_contrast(image, *window),
+        "uint8 result, arithmetic": lambda: stretch_contrast(image, *window, dtype=np.uint8, use_lut=False),
+        "uint8 result, lookup table": lambda: stretch_contrast(image, *window, dtype=np.uint8),
+        "uint8 result, lookup table, out=": lambda: stretch_contrast(image, *window, out=out),
+        "uint8 result, lookup table, whole range": lambda: stretch_contrast(image, dtype=np.uint8),
+    }
+    # both uint8 variants give the same result
+    assert np.array_equal(stretch_contrast(image, *window, dtype=np.uint8, use_lut=False),
+                          stretch_contrast(image, *window, dtype=np.uint8))
+
+    for name, function in cases.items():
+        print(f"{name}: {timeit(function):.1f} ms per {size[0]}x{size[1]} frame")
+
+
+def benchmark_chunked(shape=(200, 2048, 2048), tile_rows=4, n_threads=4):
+    # memory-mapped uint16 stack -> memory-mapped uint8 stack, the numpy allocations stay far below the stack size
+    # (tracemalloc instead of the RSS which also counts the pages of the mapped files)
+    with tempfile.TemporaryDirectory() as folder:
+        source = np.lib.format.open_memmap(os.path.join(folder, "source.npy"), "w+", np.uint16, shape)
+        for start in range(0, shape[0], tile_rows):
+            tile_shape = source[start:start + tile_rows].shape
+            source[start:start + tile_rows] = np.random.default_rng(start).integers(0, 2 ** 12, tile_shape, np.uint16)
+        source.flush()
+        del source
+
+        source = np.load(os.path.join(folder, "source.npy"), mmap_mode="r")
+        out = np.lib.format.open_memmap(os.path.join(folder, "out.npy"), "w+", np.uint8, shape)
+        tracemalloc.start()
+        start = time.perf_counter()
+        stretch_contrast_chunked(source, out, percentiles=(1, 99), tile_rows=tile_rows, n_threads=n_threads)
+        duration = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"chunked {shape} stack ({source.nbytes / 2 ** 20:.0f} MB): {duration:.2f} s, "
+              f"peak allocations {peak / 2 ** 20:.0f} MB")
+        del source, out
+
+
+if __name__ == "__main__":
+    benchmark_lut()
+    benchmark_chunked()
@@ -1,13 +1,88 @@
-def stretch_contrast(image, min=None, max=None):
+from functools import lru_cache
+
+import numpy as np
+
+
+def _valid_bound(x):
+    # integer value which is positive and smaller than the max. possible value 2^16
+    return x is not None and float(x).is_integer() and 0 <= x < 2 ** 16
+
+
+def _stretch(image, min, max, out=None, dtype=np.float64):
+    # (image - min) / (max - min) * 255 clipped to [0, 255] with a single float temporary (or none if out is float)
+    # the temporary has the float dtype of the result, float64 for integer results
+    dtype = np.dtype(dtype)
+    float_out = out is not None and out.dtype.kind == "f"
+    if float_out:
+        result = np.subtract(image, min, out=out, dtype=out.dtype)
+    else:
+        result = np.subtract(image, min, dtype=dtype if dtype.kind == "f" else np.float64)
+    # in float: max - min of integer numpy scalars may overflow (e.g. int16)
+    result /= (float(max) - float(min))
+    result *= 255
+    np.clip(result, 0, 255, out=result)
+
+    if float_out:
+        return out
+    if np.dtype(dtype if out is None else out.dtype).kind in "iu":
+        np.rint(result, out=result)
+    if out is None:
+        return result.astype(dtype, copy=False)
+    np.copyto(out, result, casting="unsafe")
+    return out
+
+
+@lru_cache(maxsize=32)
+def _lut(min, max, dtype):
+    # mapping of all 2^16 possible values, computed once per (min, max, dtype)
+    lut = _stretch(np.arange(2 ** 16, dtype=np.uint16), min, max, dtype=np.dtype(dtype))
+    lut.flags.writeable = False
+    return lut
+
+
+def _gather(lut, image, out, block_size=2 ** 20):
+    # out[...] = lut[image] in blocks of rows -> the temporaries of the gather have the size of a block, not of the image
+    row_size = image.size // image.shape[0] if image.ndim and image.shape[0] else image.size
+    rows = max(1, block_size // max(1, row_size))
+    if image.ndim == 0 or image.shape[0] <= rows:
+        out[...] = lut[image]
+        return out
+    for start in range(0, image.shape[0], rows):
+        out[start:start + rows] = lut[image[start:start + rows]]
+    return out
+
+
+def stretch_window(image, min, max, out=None, dtype=None, use_lut=None):
+    # stretch the window [min, max] of the image to [0, 255] without checking min and max
+    # dtype: dtype of the result (by default the dtype of a float image, float64 for an integer image, np.uint8 for an
+    # 8-bit image), out: array to write the result to
+    # use_lut: map 8/16-bit images with a lookup table of all 2^16 values (default for integer results)
+    if out is not None:
+        dtype = out.dtype
+    if dtype is None:
+        dtype = image.dtype if image.dtype.kind == "f" else np.float64
+    dtype = np.dtype(dtype)
+
+    if use_lut is None:
+        use_lut = dtype.kind in "iu"
+    if use_lut and image.dtype in (np.uint8, np.uint16) and _valid_bound(min) and _valid_bound(max):
+        # one gather instead of the arithmetic on every pixel
+        # (indexing does not convert the image to an intp index array like np.take does)
+        lut = _lut(int(min), int(max), dtype.str)
+        if out is None:
+            return lut[image]
+        return _gather(lut, image, out)
+
+    return _stretch(image, min, max, out, dtype)
+
+
+def stretch_contrast(image, min=None, max=None, out=None, dtype=None, use_lut=None):
     # only for grayscale images
     # if min or max are not defined, the image is stretched over the whole grayscale spectrum
 
     # check if min and max were passed and are positive and smaller than the max. possible value 2^16
-    if min is None or max is None or any(x not in range(0, 2 ** 16) for x in [min, max]):
-            stretched_image = (image - image.min()) / (image.max() - image.min()) * 255
-    else:  # stretch the image to its min and max
-            stretched_image = (image - min) / (max - min) * 255
-            stretched_image[image < min] = 0
-            stretched_image[image > max] = 255
-
-    return stretched_image
+    if not (_valid_bound(min) and _valid_bound(max)):
+        min, max = image.min(), image.max()
+    # else stretch the image to its min and max
+
+    return stretch_window(image, min, max, out, dtype, use_lut)
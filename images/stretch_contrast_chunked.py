@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from stretch_contrast_bw import stretch_window
+
+"""
+Contrast stretching of images which do not fit into memory (whole-slide images, long cine stacks).
+The source is processed in tiles along the first axis, it can be
+    - a numpy array or np.memmap: the tiles are views, only the tiles being processed are read
+    - a function returning an iterator of tiles (called once per pass) or a list of tiles
+    - a one-shot iterator of tiles, only if min and max are given (no first pass needed)
+In a first pass the global min/max (or percentiles) are computed tile by tile, in the second pass every tile is
+stretched across a thread pool into its part of the uint8 destination (e.g. a np.memmap or np.lib.format.open_memmap).
+At most 2 * n_threads tiles are in memory at the same time.
+"""
+
+
+def iter_tiles(source, tile_rows=256):
+    if isinstance(source, np.ndarray):
+        for start in range(0, source.shape[0], tile_rows):
+            yield source[start:start + tile_rows]
+    elif callable(source):
+        yield from source()
+    else:
+        yield from source
+
+
+def _bounded_map(executor, function, iterable, max_pending):
+    # like executor.map but only max_pending items are submitted at the same time -> bounded memory
+    pending = []
+    for item in iterable:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= max_pending:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+def _histogram(tile, lo, hi, bins, block_size=2 ** 20):
+    # integer images up to 16 bit: one bin per value, else bins between the global min and max
+    # computed in blocks since bincount/histogram work on int64/float64 copies of their input
+    histogram = np.zeros(bins, dtype=np.int64)
+    values = tile.ravel()
+    for start in range(0, values.size, block_size):
+        block = values[start:start + block_size]
+        if tile.dtype.kind in "iu" and tile.dtype.itemsize <= 2:
+            histogram += np.bincount(block.astype(np.int64) - int(lo), minlength=bins)
+        else:
+            histogram += np.histogram(block, bins=bins, range=(lo, hi))[0]
+    return histogram
+
+
+def streaming_range(source, percentiles=None, tile_rows=256, n_threads=4, bins=2 ** 16):
+    # global (min, max) of the source or its percentiles, e.g. percentiles=(1, 99)
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        tiles = iter_tiles(source, tile_rows)
+        ranges = list(_bounded_map(executor, lambda tile: (tile.min(), tile.max(), tile.dtype), tiles, 2 * n_threads))
+        # python numbers -> no overflow in the arithmetic with the bounds, e.g. max - min of int16 scalars
+        lo, hi = min(r[0] for r in ranges).item(), max(r[1] for r in ranges).item()
+        if percentiles is None:
+            return lo, hi
+
+        dtype = ranges[0][2]
+        integer = dtype.kind in "iu" and dtype.itemsize <= 2
+        if integer:
+            bins = int(hi) - int(lo) + 1
+        tiles = iter_tiles(source, tile_rows)
+        histogram = sum(_bounded_map(executor, lambda tile: _histogram(tile, lo, hi, bins), tiles, 2 * n_threads))
+
+    # value of the bin in which the rank of each percentile lies (the bin center for non-integer images)
+    cumulative = np.cumsum(histogram)
+    values = []
+    for percentile in percentiles:
+        rank = percentile / 100 * (cumulative[-1] - 1)
+        index = int(np.searchsorted(cumulative, rank, side="right"))
+        if integer:
+            values.append(int(lo) + index)
+        else:
+            values.append(float(lo) + (index + 0.5) * (float(hi) - float(lo)) / bins)
+    return tuple(values)
+
+
+def stretch_contrast_chunked(source, out=None, min=None, max=None, percentiles=None, tile_rows=256, n_threads=4):
+    # stretch the source to a uint8 image, out: preallocated or memory-mapped uint8 destination of the same shape
+    # without min/max the global min/max of the source is used or the given percentiles, e.g. percentiles=(1, 99)
+    if min is None or max is None:
+        if not isinstance(source, np.ndarray) and not callable(source) and iter(source) is source:
+            raise ValueError("A one-shot iterator can only be stretched with given min and max")
+        min, max = streaming_range(source, percentiles, tile_rows, n_threads)
+
+    if out is None:
+        if not isinstance(source, np.ndarray):
+            raise ValueError("out has to be given for a source of tiles")
+        out = np.empty(source.shape, dtype=np.uint8)
+
+    def stretch_tile(args):
+        start, tile = args
+        stretch_window(tile, min, max, out=out[start:start + len(tile)])
+        return len(tile)
+
+    def numbered_tiles():
+        start = 0
+        for tile in iter_tiles(source, tile_rows):
+            yield start, tile
+            start += len(tile)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        n_rows = sum(_bounded_map(executor, stretch_tile, numbered_tiles(), 2 * n_threads))
+    if n_rows != out.shape[0]:
+        raise ValueError(f"The source has {n_rows} rows, out has {out.shape[0]}")
+
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
@@ -0,0 +1,30 @@
+import numpy as np
+
+from stretch_contrast_bw import stretch_contrast
+from stretch_contrast_chunked import stretch_contrast_chunked, streaming_range
+
+
+def test_float_image_keeps_its_dtype():
+    image = np.linspace(-1, 5, 24, dtype=np.float32).reshape(4, 6)
+    result = stretch_contrast(image)
+    assert result.dtype == np.float32
+    np.testing.assert_allclose(result, (image - image.min()) / (image.max() - image.min()) * 255, rtol=1e-6)
+    assert stretch_contrast(image.astype(np.float64)).dtype == np.float64
+    assert stretch_contrast(np.arange(10, dtype=np.uint16)).dtype == np.float64
+
+
+def test_lut_out_matches_arithmetic():
+    image = np.random.default_rng(0).integers(0, 2 ** 16, (3000, 700), dtype=np.uint16)
+    out = np.empty(image.shape, dtype=np.uint8)
+    # the image is larger than one block of the gather into out
+    assert stretch_contrast(image, 1000, 40000, out=out) is out
+    np.testing.assert_array_equal(out, stretch_contrast(image, 1000, 40000, dtype=np.uint8, use_lut=False))
+
+
+def test_chunked_int16_full_range():
+    image = np.array([[-30000, 0, 30000]] * 5, dtype=np.int16)
+    lo, hi = streaming_range(image, tile_rows=2)
+    assert (lo, hi) == (-30000, 30000) and type(lo) is int
+    result = stretch_contrast_chunked(image, tile_rows=2)
+    np.testing.assert_array_equal(result, np.array([[0, 128, 255]] * 5, dtype=np.uint8))
+    np.testing.assert_array_equal(result, stretch_contrast(image, dtype=np.uint8))
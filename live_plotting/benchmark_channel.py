@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from live_plotting import CsvTailReader
+from row_writers import open_row_writer
+from shared_ring import SharedRingBuffer, SharedRingReader
+
+"""
+Latency from a sample being produced to it being available to the plot (read by the consumer), csv file
+(buffered writer, see row_writers.py) vs. shared memory channel. The producer writes rows at a fixed rate with
+x = time.perf_counter() (the same clock in every process), the consumer polls like the animation of live_plotting
+and computes the latency of every new row.
+"""
+
+
+def produce(filename, channel, rate, duration, flush_interval):
+    n_rows = int(rate * duration)
+    ring = SharedRingBuffer.create(channel, ["x", "y1", "y2"]) if channel else None
+    writer = open_row_writer(filename, ["x", "y1", "y2"], flush_rows=1000, flush_interval=flush_interval) \
+        if filename else None
+    next_time = time.perf_counter()
+    for i in range(n_rows):
+        row = (time.perf_counter(), i, -i)
+        if ring is not None:
+            ring.write(row)
+        if writer is not None:
+            writer.write(row)
+        next_time += 1 / rate
+        time.sleep(max(0.0, next_time - time.perf_counter()))
+    if writer is not None:
+        writer.close()
+    if ring is not None:
+        ring.close()
+
+
+def consume(reader, producer, poll_interval):
+    latencies = []
+    while True:
+        running = producer.poll() is None
+        n_new = reader.read_new()
+        if n_new:
+            latencies.append(time.perf_counter() - reader['x'][-n_new:])
+        elif not running:
+            return np.concatenate(latencies) if latencies else np.zeros(0)
+        time.sleep(poll_interval)
+
+
+def benchmark_latency(rate=1000, duration=3.0, poll_interval=0.01, flush_interval=1.0):
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, "data.csv")
+        channel = f"live_plotting_benchmark_{os.getpid()}"
+
+        for name, reader, producer_args in [
+                ("csv file", CsvTailReader(filename), ["--filename", filename]),
+                ("shared memory", SharedRingReader(channel), ["--channel", channel])]:
+            # the producer is a separate program like data_generation.py
+            producer = subprocess.Popen([sys.executable, __file__, "--produce", "--rate", str(rate),
+                                         "--duration", str(duration), "--flush_interval", str(flush_interval)]
+                                        + producer_args)
+            latencies = consume(reader, producer, poll_interval)
+            print(f"{name}: {len(latencies)} rows, latency median {1000 * np.median(latencies):.1f} ms, "
+                  f"p99 {1000 * np.percentile(latencies, 99):.1f} ms, max {1000 * latencies.max():.1f} ms")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="channel latency benchmark parameters")
+    parser.add_argument("--rate", type=float, default=1000, help="Rows per second.")
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--poll_interval", type=float, default=0.01, help="Time between two reads (in seconds).")
+    parser.add_argument("--flush_interval", type=float, default=1.0,
+                        help="Max. time the csv writer keeps the rows in memory (in seconds).")
+    parser.add_argument("--produce", action="store_true", help="Run the producer (used by the benchmark).")
+    parser.add_argument("--filename", type=str, default=None)
+    parser.add_argument("--channel", type=str, default=None)
+    args = parser.parse_args()
+
+    if args.produce:
+        produce(args.filename, args.channel, args.rate, args.duration, args.flush_interval)
+    else:
+        benchmark_latency(args.rate, args.duration, args.poll_interval, args.flush_interval)
@@ -0,0 +1,58 @@
+import csv
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from data_generation import generate_data
+
+"""
+Throughput (rows/s) of generate_data without sleeping for each file format, compared with the previous
+implementation (reopening the file and creating a csv.DictWriter for every row).
+"""
+
+
+def reopen_per_row(filename, n_rows, fields={"x": 0, "y1": 500, "y2": 500}):
+    with open(filename, 'w') as f:
+        csv.DictWriter(f, fieldnames=fields.keys()).writeheader()
+    for i in range(n_rows):
+        with open(filename, 'a') as f:
+            csv.DictWriter(f, fieldnames=fields.keys()).writerow({"x": i, "y1": i, "y2": i})
+
+
+def read_rows(filename):
+    if filename.endswith(".csv"):
+        return np.loadtxt(filename, delimiter=",", skiprows=1, ndmin=2)
+    if filename.endswith(".bin"):
+        return np.fromfile(filename).reshape(-1, 3)
+    return np.load(filename)
+
+
+def benchmark_formats(n_rows=200000, flush_rows=1000):
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, "reopen.csv")
+        n = n_rows // 10
+        start = time.perf_counter()
+        reopen_per_row(filename, n)
+        print(f"csv, reopened per row: {n / (time.perf_counter() - start):,.0f} rows/s")
+
+        for extension in [".csv", ".bin", ".npy"]:
+            filename = os.path.join(folder, "data" + extension)
+            start = time.perf_counter()
+            generate_data(0, filename, n_rows=n_rows, flush_rows=flush_rows, verbose=False)
+            duration = time.perf_counter() - start
+            rows = read_rows(filename)
+            assert rows.shape == (n_rows, 3) and rows[-1, 0] == n_rows - 1
+            print(f"{extension[1:]}, buffered: {n_rows / duration:,.0f} rows/s, "
+                  f"{os.path.getsize(filename) / n_rows:.1f} bytes/row")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="data generation benchmark parameters")
+    parser.add_argument("--n_rows", type=int, default=200000)
+    parser.add_argument("--flush_rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    benchmark_formats(args.n_rows, args.flush_rows)
@@ -1,35 +1,55 @@
-import csv
 import random
 import time
+from contextlib import ExitStack
 
-def generate_data(sleep_time=5, filename="data.csv", fields={"x": 0, "y1": 500, "y2": 500}):
-    field_names = fields.keys()
-    x, y1, y2 = fields["x"], fields["y1"], fields["y2"]
+from row_writers import open_row_writer
+from shared_ring import SharedRingBuffer
 
-    # write file header
-    with open(filename, 'w') as f:  # context manager
-        csv_writer = csv.DictWriter(f, fieldnames=field_names)
-        csv_writer.writeheader()
-    
-    # add data as long as the code is running
-    while True:
-        with open('data.csv', 'a') as f:
-            csv_writer = csv.DictWriter(f, fieldnames=field_names)
+"""
+The rows are written by a buffered writer (see row_writers.py), the format is chosen by the file extension
+(.csv, .bin or .npy). For high rates (e.g. --sleep_time 0.001 for 1 kHz) the rows are flushed every flush_rows rows
+or flush_interval seconds, and --quiet avoids printing every row.
+With a channel name the rows are also published immediately to a shared memory ring buffer (see shared_ring.py)
+which live_plotting reads without going through the file, filename=None (--save_path "") then skips the file.
+An existing channel of the same name is only replaced with replace_channel=True (--replace_channel), e.g. after a
+producer was killed.
+"""
+
+
+def generate_data(sleep_time=5, filename="data.csv", fields={"x": 0, "y1": 500, "y2": 500}, n_rows=None,
+                  flush_rows=1000, flush_interval=1.0, verbose=True, channel=None, capacity=2 ** 16,
+                  replace_channel=False):
+    x, y1, y2 = fields["x"], fields["y1"], fields["y2"]
 
-            data = {
-                    "x": x,
-                    "y1": y1,
-                    "y2": y2
-                    }
+    with ExitStack() as stack:
+        # the file is opened once, the writer writes the header
+        writer = stack.enter_context(open_row_writer(filename, fields.keys(), flush_rows, flush_interval)) \
+            if filename else None
+        # closed (and removed) at the end -> the readers know that no more rows come
+        ring = stack.enter_context(SharedRingBuffer.create(channel, fields.keys(), capacity, replace_channel)) \
+            if channel else None
 
-            csv_writer.writerow(data)
-            print("New row:", *data.values())
+        # the time of the next row -> the rate does not drift by the time needed to write the rows
+        next_time = time.perf_counter()
+        # add data as long as the code is running (or n_rows were written)
+        i = 0
+        while n_rows is None or i < n_rows:
+            if ring is not None:
+                ring.write((x, y1, y2))
+            if writer is not None:
+                writer.write((x, y1, y2))
+            if verbose:
+                print("New row:", x, y1, y2)
 
             x += 1
             y1 += random.randint(-3, 11)
             y2 += random.randint(-11, 3)
+            i += 1
+
+            if sleep_time:
+                next_time += sleep_time
+                time.sleep(max(0.0, next_time - time.perf_counter()))
 
-        time.sleep(sleep_time)
 
 if __name__ == "__main__":
     import argparse
@@ -42,14 +62,26 @@ if __name__ == "__main__":
                         help="Starting value of the y1 variable.")
     parser.add_argument("--y2_start", type=int, dest="y2", default=500,
                         help="Starting value of the y2 variable.")
-    parser.add_argument("--sleep_time", type=int, dest="sleep_time", default=5,
-                        help="Sleeping time between each data line addtion (in seconds).") 
+    parser.add_argument("--sleep_time", type=float, dest="sleep_time", default=5,
+                        help="Sleeping time between each data line addtion (in seconds).")
     parser.add_argument("--save_path", type=str, dest="save_path", default="data.csv",
-                        help="Path to file in which the data shall be saved.")                       
+                        help="Path to file in which the data shall be saved (.csv, .bin or .npy), \"\" for no file.")
+    parser.add_argument("--flush_rows", type=int, dest="flush_rows", default=1000,
+                        help="Number of rows kept in memory before they are written to the file.")
+    parser.add_argument("--flush_interval", type=float, dest="flush_interval", default=1.0,
+                        help="Max. time (in seconds) the rows are kept in memory before they are written.")
+    parser.add_argument("--channel", type=str, dest="channel", default=None,
+                        help="Name of the shared memory channel the rows are also published to.")
+    parser.add_argument("--capacity", type=int, dest="capacity", default=2 ** 16,
+                        help="Number of rows kept in the shared memory channel.")
+    parser.add_argument("--replace_channel", action="store_true", dest="replace_channel",
+                        help="Replace an existing channel of the same name, e.g. left over by a killed producer.")
+    parser.add_argument("--quiet", action="store_false", dest="verbose",
+                        help="Do not print every new row.")
 
     args = parser.parse_args()
     fields = {"x": args.x, "y1": args.y1, "y2": args.y2}
 
-    generate_data(args.sleep_time, args.save_path, fields)    
-
-
+    generate_data(args.sleep_time, args.save_path, fields, flush_rows=args.flush_rows,
+                  flush_interval=args.flush_interval, verbose=args.verbose, channel=args.channel,
+                  capacity=args.capacity, replace_channel=args.replace_channel)
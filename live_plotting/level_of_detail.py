@@ -0,0 +1,100 @@
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+"""
+Min/max decimation pyramid for long time series.
+The first column of the rows is x (the time), the other columns are the y values of the series.
+Level 0 holds the raw rows, every entry of level k + 1 (a bucket) holds the x range and the min. and max. y values
+of factor entries of level k. The levels are updated incrementally when rows are appended: only complete groups of
+new entries are aggregated, the remaining ones are kept pending until their group is complete.
+query() returns the points of the finest level which has at most max_points points in the x window, every bucket
+gives two points (min. and max.) -> the plot looks the same as with all points if max_points is about 2x the
+width of the plot in pixels.
+"""
+
+
+class MinMaxPyramid:
+    def __init__(self, n_columns, factor=4, n_levels=10, capacity=None):
+        self.factor = factor
+        self.n_y = n_columns - 1
+        self.raw = RingBuffer(n_columns, capacity)
+        # bucket columns: x_start, x_end, y_min (n_y columns), y_max (n_y columns)
+        self.levels = [RingBuffer(2 + 2 * self.n_y, capacity // factor ** k + 1 if capacity else None)
+                       for k in range(1, n_levels + 1)]
+        # number of entries of level k (0: raw) which are not yet aggregated into level k + 1
+        self._pending = [0] * (n_levels + 1)
+
+    def __len__(self):
+        return len(self.raw)
+
+    # same interface as RingBuffer for the raw rows
+    @property
+    def data(self):
+        return self.raw.data
+
+    def column(self, index):
+        return self.raw.column(index)
+
+    def _level_data(self, k):
+        return self.raw.data if k == 0 else self.levels[k - 1].data
+
+    def extend(self, rows):
+        self.raw.extend(rows)
+        self._pending[0] = min(self._pending[0] + len(np.atleast_2d(rows)), len(self.raw))
+
+        for k, level in enumerate(self.levels):
+            n_groups = self._pending[k] // self.factor
+            if not n_groups:
+                break
+            n = n_groups * self.factor
+            entries = self._level_data(k)[len(self._level_data(k)) - self._pending[k]:][:n]
+            entries = entries.reshape(n_groups, self.factor, -1)
+
+            if k == 0:
+                x_start, x_end = entries[:, 0, 0], entries[:, -1, 0]
+                y_min, y_max = entries[:, :, 1:].min(axis=1), entries[:, :, 1:].max(axis=1)
+            else:
+                x_start, x_end = entries[:, 0, 0], entries[:, -1, 1]
+                y_min = entries[:, :, 2:2 + self.n_y].min(axis=1)
+                y_max = entries[:, :, 2 + self.n_y:].max(axis=1)
+            level.extend(np.column_stack([x_start, x_end, y_min, y_max]))
+
+            self._pending[k] -= n
+            self._pending[k + 1] = min(self._pending[k + 1] + n_groups, len(level))
+
+    @staticmethod
+    def _bucket_points(buckets, n_y):
+        # two points per bucket: (x_start, y_min) and (x_end, y_max)
+        x = buckets[:, :2].ravel()
+        ys = [np.column_stack([buckets[:, 2 + i], buckets[:, 2 + n_y + i]]).ravel() for i in range(n_y)]
+        return x, ys
+
+    def _points(self, k, data, x_min, x_max):
+        # points of the entries of level k with x in [x_min, x_max]
+        start = max(np.searchsorted(data[:, 0], x_min, side="right") - 1, 0)
+        end = np.searchsorted(data[:, 0], x_max, side="right")
+        data = data[start:end]
+        if k == 0:
+            return data[:, 0], [data[:, 1 + i] for i in range(self.n_y)]
+        return self._bucket_points(data, self.n_y)
+
+    def query(self, x_min=-np.inf, x_max=np.inf, max_points=4000):
+        # -> x, [y of each series] of the window [x_min, x_max] with at most ~max_points points
+        for k in range(len(self.levels) + 1):
+            # the newest rows are not yet aggregated into level k, they are pending in the finer levels
+            data = self._level_data(k)
+            n_points = np.searchsorted(data[:, 0], x_max, side="right") - np.searchsorted(data[:, 0], x_min)
+            if n_points * (1 if k == 0 else 2) <= max_points or k == len(self.levels):
+                break
+
+        segments = [self._points(k, data, x_min, x_max)]
+        # add the pending entries of the finer levels (less than factor per level), they are newer than level k
+        for j in range(k - 1, -1, -1):
+            if self._pending[j]:
+                pending = self._level_data(j)[-self._pending[j]:]
+                segments.append(self._points(j, pending, x_min, x_max))
+
+        x = np.concatenate([segment[0] for segment in segments])
+        ys = [np.concatenate([segment[1][i] for segment in segments]) for i in range(self.n_y)]
+        return x, ys
@@ -1,29 +1,160 @@
+import csv
+import os
+import time
+
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
-import random
-from itertools import count
-import pandas as pd
+import numpy as np
+
+from level_of_detail import MinMaxPyramid
+from ring_buffer import RingBuffer
+from shared_ring import SharedRingReader
+
+
+class CsvTailReader:
+    # reads only the rows appended to the csv file since the last call
+    # buffer_factory(n_columns, capacity) -> buffer with extend(rows), data and column(index) (e.g. MinMaxPyramid)
+    def __init__(self, filepath, capacity=None, buffer_factory=RingBuffer):
+        self.filepath = filepath
+        self.capacity = capacity
+        self.buffer_factory = buffer_factory
+        self.columns = None
+        self.buffer = None
+        self._offset = 0
+
+    def read_new(self):
+        # returns the number of new rows
+        try:
+            if os.path.getsize(self.filepath) < self._offset:
+                # the file was rewritten (e.g. a new run of the data generation) -> start again
+                self.columns, self.buffer, self._offset = None, None, 0
+            with open(self.filepath, "rb") as f:
+                f.seek(self._offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return 0
+
+        # only complete lines, a partly written last line is read the next time
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            return 0
+        self._offset += end
+        lines = chunk[:end].decode().splitlines()
+
+        rows = [row for row in csv.reader(lines) if row]
+        if self.columns is None:
+            self.columns = rows.pop(0)
+            self.buffer = self.buffer_factory(len(self.columns), capacity=self.capacity)
+        if rows:
+            self.buffer.extend([[float(value) for value in row] for row in rows])
+        return len(rows)
+
+    def __getitem__(self, column):
+        return self.buffer.column(self.columns.index(column))
+
 
+class LivePlot:
+    # the lines are created once, each frame only the new rows are read and the line data is updated (blitting)
+    # lod: draw the min/max decimation of the rows (at most ~2 points per pixel of the axes width)
+    # window: only show the last window x units (seconds) of the rows
+    # channel: name of a shared memory channel of data_generation, read instead of the csv file
+    def __init__(self, filepath='data.csv', capacity=None, figure=None, lod=True, window=None, show_frame_time=True,
+                 channel=None):
+        buffer_factory = MinMaxPyramid if lod else RingBuffer
+        if channel is not None:
+            self.reader = SharedRingReader(channel, capacity, buffer_factory)
+        else:
+            self.reader = CsvTailReader(filepath, capacity, buffer_factory)
+        self.figure = figure or plt.gcf()
+        self.ax = self.figure.gca()
+        self.lod = lod
+        self.window = window
+        self._empty = True
 
-index = count()
-    
-def plot_data(filepath='data.csv'):
-    # read the csv file with the pandas lib and extract the values into lists
-    data = pd.read_csv(filepath)
-    x  = data['x']
-    y1 = data['y1']
-    y2 = data['y2']
+        # line color will stay the same as the lines are never recreated
+        self.line1, = self.ax.plot([], [], label='Info 1', animated=True)
+        self.line2, = self.ax.plot([], [], label='Info 2', animated=True)
 
-    # clear the plot axes to avoid overlay of lines -> line color will stay the same
-    plt.cla()
+        # frame time: duration of update() (reading + decimation), exponential moving average
+        self.frame_time = None
+        self.n_points = 0
+        self.frame_time_text = self.ax.text(0.01, 0.99, "", transform=self.ax.transAxes, va='top', fontsize=8,
+                                            animated=True, visible=show_frame_time)
 
-    # plot both lines
-    plt.plot(x, y1, label='Info 1')
-    plt.plot(x, y2, label='Info 2')
+        # define the legend's position to avoid that matplotlib automatically adapts its position
+        self.ax.legend(loc='upper right')
+        self.figure.tight_layout()
 
-    # define the legend's position to avoid that matplotlib automatically adapts its position
-    plt.legend(loc='upper right')
-    plt.tight_layout()
+    def _rescale(self, x, y):
+        # x, y: the new values, the limits only grow -> no pass over all rows
+        # the axes (ticks, labels) are not part of the blitted artists -> redraw everything if the limits change
+        (x_min, x_max), (y_min, y_max) = self.ax.get_xlim(), self.ax.get_ylim()
+        if self._empty:
+            x_min, x_max, y_min, y_max = x.min(), x.max(), y.min(), y.max()
+        elif x.min() >= x_min and x.max() <= x_max and y.min() >= y_min and y.max() <= y_max:
+            return
+        self._empty = False
+
+        x_min, x_max = min(x_min, x.min()), max(x_max, x.max())
+        y_min, y_max = min(y_min, y.min()), max(y_max, y.max())
+        # some space so that the limits do not change with every new row
+        self.ax.set_xlim(x_min, x_max + (0.2 * (x_max - x_min) or 1))
+        self.ax.set_ylim(y_min - (0.1 * (y_max - y_min) or 1), y_max + (0.1 * (y_max - y_min) or 1))
+        self.figure.canvas.draw_idle()
+
+    def _slide(self, x_last, y):
+        # the window moves with every frame -> the axes have to be redrawn anyway, the y limits fit the visible rows
+        self.ax.set_xlim(x_last - self.window, x_last)
+        y_min, y_max = y.min(), y.max()
+        self.ax.set_ylim(y_min - (0.1 * (y_max - y_min) or 1), y_max + (0.1 * (y_max - y_min) or 1))
+        self.figure.canvas.draw_idle()
+
+    def _visible_rows(self):
+        # -> x, y1, y2 of the visible window, decimated if lod
+        buffer, columns = self.reader.buffer, self.reader.columns
+        x_max = buffer.data[-1, 0]
+        x_min = x_max - self.window if self.window is not None else -np.inf
+        if self.lod:
+            max_points = 2 * max(int(self.ax.bbox.width), 1)
+            x, ys = buffer.query(x_min, x_max, max_points)
+            return x, ys[columns.index('y1') - 1], ys[columns.index('y2') - 1]
+        x = self.reader['x']
+        start = np.searchsorted(x, x_min)
+        return x[start:], self.reader['y1'][start:], self.reader['y2'][start:]
+
+    def update(self, frame=None):
+        start = time.perf_counter()
+        n_new = self.reader.read_new()
+        if n_new:
+            if self.lod or self.window is not None:
+                x, y1, y2 = self._visible_rows()
+            else:
+                x, y1, y2 = self.reader['x'], self.reader['y1'], self.reader['y2']
+            self.line1.set_data(x, y1)
+            self.line2.set_data(x, y2)
+            self.n_points = len(x)
+            if self.window is not None:
+                self._slide(x[-1], np.concatenate([y1, y2]))
+            else:
+                new = self.reader.buffer.data[-n_new:]
+                self._rescale(new[:, self.reader.columns.index('x')],
+                              new[:, [self.reader.columns.index('y1'), self.reader.columns.index('y2')]].ravel())
+
+        duration = time.perf_counter() - start
+        self.frame_time = duration if self.frame_time is None else 0.9 * self.frame_time + 0.1 * duration
+        self.frame_time_text.set_text(f"update: {1000 * duration:.1f} ms (avg. {1000 * self.frame_time:.1f} ms), "
+                                      f"{self.n_points} of {len(self.reader.buffer or [])} points")
+        return self.line1, self.line2, self.frame_time_text
+
+    def animate(self, interval=1000):
+        return FuncAnimation(self.figure, self.update, interval=interval, blit=True, cache_frame_data=False)
+
+
+def plot_data(filepath='data.csv', interval=1000, lod=True, window=None, channel=None):
+    # pass the current figure and the update function to FuncAnimation,
+    # define the reading interval (time in ms between reading in the new data from the csv file or the channel)
+    live_plot = LivePlot(filepath, lod=lod, window=window, channel=channel)
+    return live_plot, live_plot.animate(interval)
 
 
 if __name__ == "__main__":
@@ -31,14 +162,18 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="data plotting parameters")
 
     parser.add_argument("--interval", type=int, dest="interval", default=1000,
-                        help="Time after which the plot is refreshed.") 
+                        help="Time after which the plot is refreshed.")
     parser.add_argument("--load_path", type=str, dest="load_path", default="data.csv",
-                        help="Path to file from which the data shall be read.")                       
+                        help="Path to file from which the data shall be read.")
+    parser.add_argument("--window", type=float, dest="window", default=None,
+                        help="Only show the last WINDOW x units (seconds) of the data.")
+    parser.add_argument("--channel", type=str, dest="channel", default=None,
+                        help="Name of the shared memory channel of data_generation, read instead of the file.")
+    parser.add_argument("--no_lod", action="store_false", dest="lod",
+                        help="Draw all rows instead of their min/max decimation.")
     args = parser.parse_args()
 
-    # pass current figure via plt.gcf() and the data plotting function to FuncAnimation, 
-    # define the reading interval (time in ms between reading in the data from the csv file)
-    FuncAnimation(plt.gcf(), plot_data, interval=args.interval, fargs=args.filepath)
-    
-    plt.tight_layout()
+    # keep a reference to the animation, else it is garbage collected
+    live_plot, animation = plot_data(args.load_path, args.interval, args.lod, args.window, args.channel)
+
     plt.show()
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+class RingBuffer:
+    # rows of float values, grows (doubling) up to capacity and then overwrites the oldest rows
+    # every row is written twice (at i and i + size) so that the rows are always available as one contiguous
+    # view in their order -> appending and reading cost only as much as the new rows
+    def __init__(self, n_columns, capacity=None, initial_size=1024):
+        self.capacity = capacity
+        self._size = initial_size if capacity is None else min(initial_size, capacity)
+        self._buffer = np.empty((2 * self._size, n_columns))
+        self._start = 0
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def _grow(self):
+        data = self.data.copy()
+        self._size = 2 * self._size if self.capacity is None else min(2 * self._size, self.capacity)
+        self._buffer = np.empty((2 * self._size, self._buffer.shape[1]))
+        self._buffer[:len(data)] = data
+        self._buffer[self._size:self._size + len(data)] = data
+        self._start = 0
+
+    def extend(self, rows):
+        rows = np.asarray(rows, dtype=float).reshape(-1, self._buffer.shape[1])
+        if self.capacity is not None and len(rows) > self.capacity:
+            rows = rows[-self.capacity:]
+        while self._length + len(rows) > self._size and (self.capacity is None or self._size < self.capacity):
+            self._grow()
+
+        # positions after the last row, the oldest rows are overwritten if the buffer is full
+        positions = (self._start + self._length + np.arange(len(rows))) % self._size
+        self._buffer[positions] = rows
+        self._buffer[positions + self._size] = rows
+        overwritten = max(0, self._length + len(rows) - self._size)
+        self._length = min(self._size, self._length + len(rows))
+        self._start = (self._start + overwritten) % self._size
+
+    @property
+    def data(self):
+        # view of the rows, the oldest first
+        return self._buffer[self._start:self._start + self._length]
+
+    def column(self, index):
+        return self.data[:, index]
@@ -0,0 +1,128 @@
+import csv
+import os
+import struct
+import time
+
+import numpy as np
+
+"""
+Buffered writers for rows of float values streamed at high rates (e.g. sensor data at kHz).
+The file is opened once, the rows are collected in memory and written when flush_rows rows are pending or
+flush_interval seconds have passed since the last flush:
+    with open_row_writer("data.npy", ["x", "y1", "y2"]) as writer:
+        writer.write([x, y1, y2])
+Formats (chosen by the file extension):
+- .csv: text with a header line, readable by live_plotting
+- .bin: fixed-width little endian float64 records (struct), np.fromfile(filename).reshape(-1, n_fields)
+- .npy: float64 array of shape (n_rows, n_fields), the header is updated with every flush -> np.load(filename)
+  always gives the rows written so far
+"""
+
+
+class BufferedRowWriter:
+    def __init__(self, filename, field_names, flush_rows=1000, flush_interval=1.0):
+        self.filename = filename
+        self.field_names = list(field_names)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.n_rows = 0  # rows written to the file
+        self._rows = []
+        self._last_flush = time.monotonic()
+        self._file = self._open()
+        self._write_header()
+
+    def _open(self):
+        return open(self.filename, "wb")
+
+    def _write_header(self):
+        pass
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def write_rows(self, rows):
+        self._rows.extend(rows)
+        if len(self._rows) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            self._write_rows(self._rows)
+            self.n_rows += len(self._rows)
+            self._rows = []
+        # to the OS, not to the disk (no fsync) -> readers of the file see the rows
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvRowWriter(BufferedRowWriter):
+    def _open(self):
+        # newline="" as recommended for the csv module
+        return open(self.filename, "w", newline="")
+
+    def _write_header(self):
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.field_names)
+
+    def _write_rows(self, rows):
+        self._writer.writerows(rows)
+
+
+class StructRowWriter(BufferedRowWriter):
+    def _write_header(self):
+        self._struct = struct.Struct("<" + "d" * len(self.field_names))
+
+    def _write_rows(self, rows):
+        # one bytes object for all rows instead of one write per row
+        self._file.write(b"".join(self._struct.pack(*row) for row in rows))
+
+
+class NpyRowWriter(BufferedRowWriter):
+    # the header has a fixed size, large enough for every shape -> it is rewritten in place
+    header_size = 128
+
+    def _header(self):
+        header = "{{'descr': '<f8', 'fortran_order': False, 'shape': ({}, {}), }}".format(
+            self.n_rows, len(self.field_names))
+        header = header.ljust(self.header_size - 10 - 1) + "\n"
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+    def _write_header(self):
+        self._file.write(self._header())
+
+    def _write_rows(self, rows):
+        self._file.write(np.asarray(rows, dtype="<f8").tobytes())
+
+    def flush(self):
+        super().flush()
+        # the rows first, then the shape -> a reader never sees more rows in the header than in the file
+        self._file.seek(0)
+        self._file.write(self._header())
+        self._file.seek(0, os.SEEK_END)
+        self._file.flush()
+
+
+ROW_WRITERS = {".csv": CsvRowWriter, ".bin": StructRowWriter, ".npy": NpyRowWriter}
+
+
+def open_row_writer(filename, field_names, flush_rows=1000, flush_interval=1.0):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in ROW_WRITERS:
+        raise ValueError(f"unknown format {extension}, use one of {list(ROW_WRITERS)}")
+    return ROW_WRITERS[extension](filename, field_names, flush_rows, flush_interval)
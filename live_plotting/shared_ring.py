@@ -0,0 +1,180 @@
+import json
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+"""
+Ring buffer of float64 rows in shared memory between one producer (generate_data) and consumers (plot_data)
+on the same machine, no file and no text formatting/parsing in between:
+    producer: channel = SharedRingBuffer.create("live_data", ["x", "y1", "y2"], capacity=2 ** 16)
+              channel.write(row)
+    consumer: reader = SharedRingReader("live_data")
+              n_new = reader.read_new()  # -> reader.buffer, reader["y1"] like CsvTailReader
+Layout of the shared memory: header (int64: magic, n_columns, capacity, sequence number, closed), the column
+names as json, the rows. The sequence number is the total number of rows written, row i is stored at
+i % capacity. The producer writes the rows first and then increases the sequence number, a consumer copies the
+rows between its last and the current sequence number and checks afterwards that they were not overwritten in the
+meantime (i.e. it was not more than capacity rows behind).
+"""
+
+_MAGIC = 0x4C495645  # "LIVE"
+_HEADER = 5
+_NAMES_SIZE = 1024
+_MAGIC_, _N_COLUMNS, _CAPACITY, _SEQUENCE, _CLOSED = range(_HEADER)
+
+
+def _attach(name):
+    # only the creating process shall unlink the memory, before python 3.13 the resource tracker of an attaching
+    # process unlinks it on exit
+    memory = shared_memory.SharedMemory(name)
+    try:
+        resource_tracker.unregister(memory._name, "shared_memory")
+    except Exception:
+        pass
+    return memory
+
+
+class SharedRingBuffer:
+    def __init__(self, memory, owner=False):
+        self.memory = memory
+        self.owner = owner
+        self.header = np.ndarray((_HEADER,), dtype=np.int64, buffer=memory.buf)
+        if self.header[_MAGIC_] != _MAGIC:
+            raise ValueError(f"{memory.name} is not a shared ring buffer")
+        self.n_columns, self.capacity = int(self.header[_N_COLUMNS]), int(self.header[_CAPACITY])
+        names = bytes(memory.buf[8 * _HEADER:8 * _HEADER + _NAMES_SIZE]).rstrip(b"\0")
+        self.columns = json.loads(names.decode())
+        self.rows = np.ndarray((self.capacity, self.n_columns), dtype=np.float64, buffer=memory.buf,
+                               offset=8 * _HEADER + _NAMES_SIZE)
+
+    @classmethod
+    def create(cls, name, columns, capacity=2 ** 16, replace=False):
+        # FileExistsError if the channel exists (e.g. another producer with the same name), replace=True replaces
+        # it, e.g. the memory left over by a producer which was killed (its readers are detached)
+        columns = list(columns)
+        names = json.dumps(columns).encode()
+        if len(names) > _NAMES_SIZE:
+            raise ValueError("the column names are too long")
+        try:
+            memory = shared_memory.SharedMemory(name, create=True,
+                                                size=8 * _HEADER + _NAMES_SIZE + 8 * capacity * len(columns))
+        except FileExistsError:
+            if not replace:
+                raise FileExistsError(f"the channel {name} exists, replace=True replaces it") from None
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            memory = shared_memory.SharedMemory(name, create=True,
+                                                size=8 * _HEADER + _NAMES_SIZE + 8 * capacity * len(columns))
+        memory.buf[8 * _HEADER:8 * _HEADER + len(names)] = names
+        header = np.ndarray((_HEADER,), dtype=np.int64, buffer=memory.buf)
+        header[:] = [_MAGIC, len(columns), capacity, 0, 0]
+        del header  # no exported buffers must be left when the memory is closed
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach(name))
+
+    @property
+    def sequence(self):
+        return int(self.header[_SEQUENCE])
+
+    @property
+    def closed(self):
+        return bool(self.header[_CLOSED])
+
+    def write(self, row):
+        sequence = int(self.header[_SEQUENCE])
+        self.rows[sequence % self.capacity] = row
+        # published after the row was written
+        self.header[_SEQUENCE] = sequence + 1
+
+    def write_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, self.n_columns)[-self.capacity:]
+        sequence = int(self.header[_SEQUENCE])
+        self.rows[(sequence + np.arange(len(rows))) % self.capacity] = rows
+        self.header[_SEQUENCE] = sequence + len(rows)
+
+    def read(self, start):
+        # -> (rows with sequence numbers from start on, sequence number after the rows), the rows are a copy
+        # if the consumer is more than capacity rows behind, the older rows are lost
+        end = self.sequence
+        start = max(start, end - self.capacity)
+        rows = self.rows[np.arange(start, end) % self.capacity]
+        # rows overwritten by the producer while they were copied are dropped (the row at the current sequence
+        # number may be half written)
+        overwritten = self.sequence + 1 - self.capacity - start
+        if overwritten > 0:
+            rows, start = rows[overwritten:], start + overwritten
+        return rows, end
+
+    def close(self):
+        # the producer marks the end of the data, consumers keep the rows they have
+        if self.owner:
+            self.header[_CLOSED] = 1
+        self.header, self.rows = None, None
+        self.memory.close()
+        if self.owner:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                pass  # already replaced by another producer (replace=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SharedRingReader:
+    # same interface as live_plotting.CsvTailReader, reads the rows written since the last call
+    def __init__(self, name, capacity=None, buffer_factory=RingBuffer):
+        self.name = name
+        self.capacity = capacity
+        self.buffer_factory = buffer_factory
+        self.columns = None
+        self.buffer = None
+        self.lost = 0  # rows overwritten before they were read
+        self._channel = None
+        self._sequence = 0
+
+    def read_new(self):
+        # returns the number of new rows
+        if self._channel is None:
+            try:
+                self._channel = SharedRingBuffer.attach(self.name)
+            except FileNotFoundError:
+                return 0
+            if self._channel.closed:
+                # the producer has finished and is about to remove the memory
+                self._channel.close()
+                self._channel = None
+                return 0
+            self.columns = self._channel.columns
+            self.buffer = self.buffer_factory(len(self.columns), capacity=self.capacity)
+            self._sequence = 0
+
+        # the producer sets closed after its last row -> read the rows after looking at closed
+        closed = self._channel.closed
+        rows, end = self._channel.read(self._sequence)
+        self.lost += end - self._sequence - len(rows)
+        self._sequence = end
+        if len(rows):
+            self.buffer.extend(rows)
+        if closed:
+            # a new producer creates a new memory with the same name
+            self._channel.close()
+            self._channel = None
+        return len(rows)
+
+    def __getitem__(self, column):
+        return self.buffer.column(self.columns.index(column))
+
+    def close(self):
+        if self._channel is not None:
+            self._channel.close()
+            self._channel = None